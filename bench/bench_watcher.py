@@ -0,0 +1,250 @@
+"""Benchmark the chain watcher against the local mock Torn API.
+
+Starts `mock_torn.py` in a subprocess, runs `ChainEngine` against it in real
+time and reports poll-to-display latency, alarm latency against the true
+deadline, wakeups per minute and memory growth.
+
+    python bench/bench_watcher.py --duration 300 --latency 0.08 --jitter 0.03 --save baseline.json
+    python bench/bench_watcher.py --duration 300 --latency 0.08 --jitter 0.03 --baseline baseline.json
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from chain_engine import ChainEngine  # noqa: E402
+from chain_sim import SimulationReport  # noqa: E402
+from mock_torn import add_mock_arguments, make_trace  # noqa: E402
+from mock_webhook import MockWebhookServer  # noqa: E402
+from torn_api import TornApiClient  # noqa: E402
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Metrics compared against a baseline; all of them are "lower is better"
+CHECKED = ("poll_to_display_ms.p90", "alarm_delay_ms.p90", "pre_alarm_delay_ms.p90", "wakeups_per_minute",
+           "memory_growth_kb")
+# A regression must be this much worse than the baseline, relatively and absolutely
+TOLERANCE = 0.2
+SLACK = {"poll_to_display_ms.p90": 50, "alarm_delay_ms.p90": 50, "pre_alarm_delay_ms.p90": 50,
+         "wakeups_per_minute": 5, "memory_growth_kb": 256}
+
+
+def percentiles(values):
+    if not values:
+        return None
+    ordered = sorted(values)
+
+    def rank(fraction):
+        return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))], 2)
+
+    return {"count": len(ordered), "p50": rank(0.5), "p90": rank(0.9), "p99": rank(0.99), "max": round(ordered[-1], 2)}
+
+
+def context_switches():
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_nvcsw + usage.ru_nivcsw
+
+
+class Probe:
+    """Engine listener timing each poll until the countdown that shows it."""
+
+    def __init__(self):
+        self.display_latencies = []
+        self.loop_wakeups = 0
+        self._pending = None
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        now = time.perf_counter()
+        with self._lock:
+            if event["type"] in ("poll", "poll_unchanged", "poll_failed", "tick"):
+                self.loop_wakeups += 1
+            if event["type"] == "poll":
+                # Only a changed chain has anything new to display; the request went out `total` seconds before its reply was handled
+                self._pending = now - event["timing"]["total"]
+            elif event["type"] == "tick" and self._pending is not None:
+                self.display_latencies.append((now - self._pending) * 1000)
+                self._pending = None
+
+
+def start_mock(args):
+    command = [sys.executable, os.path.join(BENCH_DIR, "mock_torn.py"), "--port", "0",
+               "--latency", str(args.latency), "--jitter", str(args.jitter),
+               "--error-rate", str(args.error_rate), "--rate-limit", str(args.rate_limit),
+               "--slow-rate", str(args.slow_rate), "--slow-latency", str(args.slow_latency),
+               "--hit-rate", str(args.hit_rate), "--chain-timeout", str(args.chain_timeout),
+               "--duration", str(args.duration), "--start", str(args.start), "--seed", str(args.seed)]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    url = process.stdout.readline().strip().rpartition(" ")[2]
+    if not url.startswith("http"):
+        process.kill()
+        raise RuntimeError("Mock Torn API failed to start")
+    return process, url
+
+
+def run(args):
+    args.start = time.time() + 1
+    # The mock builds its own trace from the same arguments: both must draw the same chain
+    if args.seed is None:
+        args.seed = random.randrange(2 ** 31)
+    trace = make_trace(args)
+    mock, url = start_mock(args)
+
+    webhook = None
+    if args.webhook_delay is not None:
+        # A slow webhook sink must not show up in any of the watcher's timings
+        webhook = MockWebhookServer(("127.0.0.1", 0), delay=args.webhook_delay, quiet=True)
+        threading.Thread(target=webhook.serve_forever, daemon=True).start()
+
+    settings = {
+        "api_key": ",".join(f"bench{i}" for i in range(args.keys)),
+        "alarm_trigger_seconds": args.alarm,
+        "pre_alarm_trigger_seconds": args.pre_alarm,
+        "record_history": False,
+        "hedge_requests": args.hedge,
+        "notify_webhook": webhook.url if webhook is not None else "",
+    }
+    tracemalloc.start()
+    client = TornApiClient(base_url=url, pool_size=8)
+    engine = ChainEngine(settings, client)
+    probe = Probe()
+    report = SimulationReport(trace)
+    engine.subscribe(probe)
+    engine.subscribe(report)
+    from chain_notify import start_notifications
+    notifications = start_notifications(engine, engine.settings)
+
+    memory = []
+    switches_before = context_switches()
+    engine.start()
+    started = time.monotonic()
+    try:
+        while time.monotonic() - started < args.duration:
+            time.sleep(min(10, args.duration - (time.monotonic() - started)))
+            memory.append(tracemalloc.get_traced_memory()[0])
+            print(f"  {time.monotonic() - started:5.0f}s  {report.polls} polls, "
+                  f"{len(report.transitions)} alarm transitions", file=sys.stderr)
+    finally:
+        engine.stop()
+        notifications.close()
+        mock.terminate()
+        mock.wait()
+        if webhook is not None:
+            webhook.shutdown()
+            webhook.server_close()
+    elapsed_minutes = (time.monotonic() - started) / 60
+    switches_after = context_switches()
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    def delays(state, trigger):
+        # How long after the true threshold crossing the alarm went off
+        return [(trigger - t["true_remaining"]) * 1000 for t in report.transitions if t["state"] == state]
+
+    return {
+        "duration_s": args.duration,
+        "polls": report.polls,
+        "failed_polls": report.failed_polls,
+        "poll_to_display_ms": percentiles(probe.display_latencies),
+        "alarm_delay_ms": percentiles(delays("alarm", args.alarm)),
+        "pre_alarm_delay_ms": percentiles(delays("pre-alarm", args.pre_alarm)),
+        "breaks": len(trace.breaks()),
+        "breaks_without_alarm": len(report.missed_breaks()),
+        "wakeups_per_minute": round(probe.loop_wakeups / elapsed_minutes, 1),
+        "context_switches_per_minute": (round((switches_after - switches_before) / elapsed_minutes, 1)
+                                        if switches_before is not None else None),
+        # Growth after the first sample, so start-up allocations don't count
+        "memory_growth_kb": round((memory[-1] - memory[0]) / 1024, 1) if len(memory) > 1 else 0.0,
+        "memory_peak_kb": round(peak / 1024, 1),
+        "hedging": client.hedge_stats.as_dict() if args.hedge else None,
+        "notifications": notifications.stats() if webhook is not None else None,
+    }
+
+
+def lookup(results, name):
+    value = results
+    for part in name.split("."):
+        value = value.get(part) if isinstance(value, dict) else None
+    return value
+
+
+def compare(results, baseline):
+    """Names and values of the metrics that got worse than the baseline allows."""
+    regressions = []
+    for name in CHECKED:
+        current, previous = lookup(results, name), lookup(baseline, name)
+        if current is None or previous is None:
+            continue
+        if current > previous * (1 + TOLERANCE) + SLACK[name]:
+            regressions.append(f"{name}: {current} (baseline {previous})")
+    return regressions
+
+
+def describe(results):
+    lines = [f"{results['polls']} polls ({results['failed_polls']} failed) in {results['duration_s']:.0f}s"]
+    for name in ("poll_to_display_ms", "alarm_delay_ms", "pre_alarm_delay_ms"):
+        stats = results[name]
+        if stats is None:
+            lines.append(f"{name:22} no samples")
+        else:
+            lines.append(f"{name:22} p50 {stats['p50']:8.1f}  p90 {stats['p90']:8.1f}  "
+                         f"p99 {stats['p99']:8.1f}  max {stats['max']:8.1f}  (n={stats['count']})")
+    lines.append(f"{'breaks':22} {results['breaks']} ({results['breaks_without_alarm']} without an alarm)")
+    lines.append(f"{'wakeups/min':22} {results['wakeups_per_minute']} engine, "
+                 f"{results['context_switches_per_minute']} context switches")
+    lines.append(f"{'memory':22} {results['memory_growth_kb']} KiB growth, {results['memory_peak_kb']} KiB peak")
+    for stats in results.get("notifications") or ():
+        lines.append(f"{'notify ' + stats['sink']:22} {stats['delivered']} delivered, {stats['coalesced']} merged, "
+                     f"{stats['dropped']} dropped, {stats['failed']} failed, {stats['pending']} pending")
+    hedging = results.get("hedging")
+    if hedging:
+        lines.append(f"{'hedging':22} {hedging['hedges']} extra requests over {hedging['requests']} panic polls, "
+                     f"{hedging['wins']} answered first, {hedging['saved_seconds']:.2f}s saved")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_mock_arguments(parser)
+    parser.set_defaults(duration=300, chain_timeout=90, hit_rate=1.0)
+    parser.add_argument("--alarm", type=int, default=30, help="Alarm threshold in seconds (default: %(default)s)")
+    parser.add_argument("--pre-alarm", type=int, default=45,
+                        help="Pre-alarm threshold in seconds (default: %(default)s)")
+    parser.add_argument("--keys", type=int, default=1, help="Number of API keys in the pool")
+    parser.add_argument("--hedge", action="store_true", help="Race slow panic-mode polls with a second request")
+    parser.add_argument("--webhook-delay", type=float, metavar="SECONDS",
+                        help="Send alarms to a local webhook stand-in that answers this slowly")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    parser.add_argument("--save", metavar="FILE", help="Write the results to FILE as a baseline")
+    parser.add_argument("--baseline", metavar="FILE", help="Fail if results are worse than this baseline")
+    args = parser.parse_args()
+
+    results = run(args)
+    print(json.dumps(results, indent=2) if args.json else describe(results))
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f))
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
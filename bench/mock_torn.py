@@ -0,0 +1,163 @@
+"""Local stand-in for the Torn API chain selection, for benchmarks.
+
+Serves `/faction/?selections=chain,timestamp` from a synthetic chain trace in real
+time, with configurable latency, jitter, failure rate and per-key rate limiting.
+
+    python bench/mock_torn.py --port 8099 --latency 0.08 --jitter 0.03 --error-rate 0.02
+"""
+import argparse
+import collections
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chain_sim import CHAIN_TIMEOUT, ChainTrace  # noqa: E402
+from torn_api import TORN_RATE_LIMIT  # noqa: E402
+
+
+class MockTornServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, trace, latency=0.05, jitter=0.0, error_rate=0.0, rate_limit=TORN_RATE_LIMIT,
+                 seed=None, slow_rate=0.0, slow_latency=2.0):
+        super().__init__(address, MockTornHandler)
+        self.trace = trace
+        self.latency = latency
+        self.jitter = jitter
+        self.slow_rate = slow_rate  # Share of requests stalled for `slow_latency`, like Torn at peak
+        self.slow_latency = slow_latency
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.requests = collections.Counter()  # Responses sent, by kind
+        self._calls = collections.defaultdict(collections.deque)  # Key -> request times in the last minute
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def delay(self):
+        with self._lock:
+            if self.slow_rate and self._random.random() < self.slow_rate:
+                return self.slow_latency
+            return max(0.0, self._random.gauss(self.latency, self.jitter)) if self.jitter else self.latency
+
+    def fails(self):
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def over_limit(self, key, now):
+        with self._lock:
+            calls = self._calls[key]
+            while calls and calls[0] <= now - 60:
+                calls.popleft()
+            if len(calls) >= self.rate_limit:
+                return True
+            calls.append(now)
+            return False
+
+    def count(self, kind):
+        with self._lock:
+            self.requests[kind] += 1
+
+
+class MockTornHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if not url.path.startswith("/faction"):
+            self.send_json(404, {"error": "not found"})
+            return
+
+        time.sleep(server.delay())
+        now = time.time()
+        key = query.get("key", [""])[0]
+        if not key:
+            server.count("no_key")
+            self.send_json(200, {"error": {"code": 2, "error": "Incorrect key"}})
+        elif server.over_limit(key, now):
+            server.count("rate_limited")
+            self.send_json(200, {"error": {"code": 5, "error": "Too many requests"}})
+        elif server.fails():
+            server.count("failed")
+            self.send_json(502, {"error": "Bad gateway"})
+        else:
+            server.count("ok")
+            self.send_json(200, {"chain": server.trace.state_at(now), "timestamp": math.floor(now)})
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def add_mock_arguments(parser):
+    parser.add_argument("--latency", type=float, default=0.05, help="Mean response latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Standard deviation of the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 502")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Fraction of requests that stall")
+    parser.add_argument("--slow-latency", type=float, default=2.0,
+                        help="Latency of a stalled request in seconds (default: %(default)s)")
+    parser.add_argument("--rate-limit", type=int, default=TORN_RATE_LIMIT,
+                        help="Requests per key per minute before Torn error 5 (default: %(default)s)")
+    parser.add_argument("--hit-rate", type=float, default=1.0, help="Average chain hits per minute")
+    parser.add_argument("--chain-timeout", type=int, default=CHAIN_TIMEOUT,
+                        help="Seconds a hit keeps the chain alive (default: %(default)s)")
+    parser.add_argument("--duration", type=float, default=3600, help="Length of the chain trace in seconds")
+    parser.add_argument("--seed", type=int, help="Random seed for the chain and failures")
+    parser.add_argument("--start", type=float, help="Epoch time the chain trace starts (default: now)")
+
+
+def make_trace(args):
+    """The chain the server plays; the same arguments always give the same trace."""
+    start = time.time() if args.start is None else args.start
+    return ChainTrace.synthetic(args.duration, args.hit_rate, timeout=args.chain_timeout, start=start,
+                                seed=args.seed)
+
+
+def make_server(args, host="127.0.0.1", port=0):
+    trace = make_trace(args)
+    return MockTornServer((host, port), trace, latency=args.latency, jitter=args.jitter,
+                          error_rate=args.error_rate, rate_limit=args.rate_limit, seed=args.seed,
+                          slow_rate=args.slow_rate, slow_latency=args.slow_latency)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    server = make_server(args, args.host, args.port)
+    print(f"Mock Torn API on {server.url}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps(dict(server.requests)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
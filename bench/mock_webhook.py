@@ -0,0 +1,79 @@
+"""Local stand-in for a webhook endpoint (Discord, Slack, ...), for testing notifications.
+
+Prints every JSON body it receives, optionally answering slowly or with an
+error status to check that a bad sink never holds up the watcher.
+
+    python bench/mock_webhook.py --port 8098 --delay 5
+    python chainwatch.py daemon --notify-webhook http://127.0.0.1:8098/hook
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockWebhookServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, delay=0.0, status=204, quiet=False):
+        super().__init__(address, MockWebhookHandler)
+        self.delay = delay
+        self.status = status
+        self.quiet = quiet
+        self.received = []  # (receive time, decoded body)
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/hook"
+
+    def record(self, body):
+        with self._lock:
+            self.received.append((time.time(), body))
+        if not self.quiet:
+            print(json.dumps(body), flush=True)
+
+
+class MockWebhookHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            body = json.loads(self.rfile.read(length) or b"null")
+        except ValueError:
+            self.send_error(400)
+            return
+        server = self.server
+        if server.delay:
+            time.sleep(server.delay)
+        server.record(body)
+        self.send_response(server.status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8098)
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds to wait before answering")
+    parser.add_argument("--status", type=int, default=204, help="HTTP status to answer with (default: %(default)s)")
+    args = parser.parse_args()
+
+    server = MockWebhookServer((args.host, args.port), delay=args.delay, status=args.status)
+    print(f"Mock webhook listening on {server.url}", file=sys.stderr, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+
+from chain_config import ALARM_SOUNDS_SHA256, ALARM_SOUNDS_URLS, DATA_FOLDER
+
+
+log = logging.getLogger("chainwatch.assets")
+
+ASSET_MANIFEST = os.path.join(DATA_FOLDER, "assets.json")
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class AssetCache:
+    """The default alarm sounds in `DATA_FOLDER`, fetched in the background and checksum-verified.
+
+    A URL with a digest in `pins` must serve exactly that file: a download that
+    differs is refused, and a file on disk that differs is fetched again. For
+    other URLs the SHA-256 is kept in a manifest when the file is downloaded (or
+    first seen), and a file that no longer matches it, such as one cut short by a
+    crash mid-download, is fetched again. Downloads go to a temporary name and are
+    renamed into place, so a half-written file is never picked up as a sound.
+    """
+
+    def __init__(self, urls=ALARM_SOUNDS_URLS, manifest_path=ASSET_MANIFEST, pins=ALARM_SOUNDS_SHA256):
+        self.urls = dict(urls)
+        self.manifest_path = manifest_path
+        self.pins = {url: digest for url, digest in pins.items() if digest}
+        self._lock = threading.Lock()
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_manifest(self, manifest):
+        temporary = self.manifest_path + ".tmp"
+        with open(temporary, "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(temporary, self.manifest_path)
+
+    def missing(self):
+        """Paths that are absent or fail their checksum."""
+        with self._lock:
+            manifest = self._load_manifest()
+            missing = []
+            changed = False
+            for path, url in self.urls.items():
+                if not os.path.exists(path):
+                    missing.append(path)
+                    continue
+                entry = manifest.get(path)
+                digest = file_sha256(path)
+                if url in self.pins:
+                    if digest != self.pins[url]:
+                        missing.append(path)
+                elif entry is None or entry.get("url") != url:
+                    # A file we did not download ourselves; trust it from now on
+                    manifest[path] = {"url": url, "sha256": digest}
+                    changed = True
+                elif entry["sha256"] != digest:
+                    missing.append(path)
+            if changed:
+                self._save_manifest(manifest)
+            return missing
+
+    def download(self, path):
+        import urllib.request
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        url = self.urls[path]
+        temporary = path + ".part"
+        try:
+            urllib.request.urlretrieve(url, temporary)
+            digest = file_sha256(temporary)
+            if url in self.pins and digest != self.pins[url]:
+                raise ValueError(f"{url} served a file with SHA-256 {digest}, not the expected {self.pins[url]}")
+            os.replace(temporary, path)
+        finally:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+        with self._lock:
+            manifest = self._load_manifest()
+            manifest[path] = {"url": url, "sha256": digest}
+            self._save_manifest(manifest)
+
+    def provision(self, on_status=None):
+        """Download whatever is missing; returns the paths that failed.
+
+        `on_status(state, message)` hears "downloading", "ready" and "failed".
+        """
+        def report(state, message):
+            if on_status is not None:
+                on_status(state, message)
+
+        failed = []
+        missing = self.missing()
+        for index, path in enumerate(missing, 1):
+            report("downloading", f"Downloading alarm sounds ({index}/{len(missing)})...")
+            try:
+                self.download(path)
+            except Exception as e:
+                log.warning(f"Failed to download {path}: {e}")
+                failed.append(path)
+        if failed:
+            report("failed", f"Could not download {len(failed)} alarm sound(s); those alarms will be silent")
+        else:
+            report("ready", "Alarm sounds downloaded" if missing else "")
+        return failed
+
+    def start(self, on_status=None):
+        """Provision on a background thread."""
+        thread = threading.Thread(target=self.provision, args=(on_status,), daemon=True)
+        thread.start()
+        return thread
+
@@ -0,0 +1,101 @@
+import threading
+
+
+# Longest an attack can run (Torn fights time out after five minutes): each request
+# reaches back this far, so an attack started before one already seen but finished
+# after it is still picked up
+ATTACK_OVERLAP = 300
+
+
+class AttackLog:
+    """The faction's attack log, read incrementally alongside the chain.
+
+    Every poll asks for the `attacks` selection `from` `ATTACK_OVERLAP` seconds
+    before the cursor, the end time of the newest attack seen. Attacks already
+    counted are told apart by their ID, remembered for as long as a reply can
+    repeat them. The faction's own outgoing hits are tallied per member.
+
+    Which side of an attack is ours takes the faction's ID, from `faction_id` or
+    `set_faction()`. Until it is known attacks are left alone, not marked seen,
+    so the next reply brings them back to be counted.
+    """
+
+    def __init__(self, faction_id=None, since=None):
+        self._lock = threading.Lock()
+        self.reset(faction_id, since)
+
+    def reset(self, faction_id=None, since=None):
+        with self._lock:
+            self.faction_id = int(faction_id) if faction_id else None
+            self.since = int(since) if since is not None else None  # Attacks that ended earlier are ignored
+            self.cursor = self.since
+            self.members = {}  # Attacker ID -> tally
+            self.hits = 0
+            self.last_hit = None  # (time, member name) of the newest hit
+            self._seen = {}  # Attack ID -> end time, of the attacks a reply may still repeat
+
+    def set_faction(self, faction_id):
+        """Name the faction whose hits are counted, once it is known."""
+        with self._lock:
+            self.faction_id = int(faction_id) if faction_id else None
+
+    def request_from(self):
+        """The `from` time for the next request, or None for Torn's default."""
+        with self._lock:
+            return self.cursor - ATTACK_OVERLAP if self.cursor is not None else None
+
+    def update(self, attacks):
+        """Take in an `attacks` selection; returns the faction's new chain hits, oldest first."""
+        if isinstance(attacks, dict):
+            attacks = [dict(attack, id=attack_id) for attack_id, attack in attacks.items()]
+        with self._lock:
+            if self.faction_id is None:
+                return []
+            fresh = []
+            for attack in sorted(attacks or (), key=_ended):
+                ended = _ended(attack)
+                attack_id = str(attack.get("id", attack.get("code", "")))
+                if attack_id in self._seen or (self.since is not None and ended < self.since):
+                    continue
+                self._seen[attack_id] = ended
+                self.cursor = ended if self.cursor is None else max(self.cursor, ended)
+                fresh.append(attack)
+            if self.cursor is not None:
+                # Older than any reply can reach back to
+                horizon = self.cursor - 2 * ATTACK_OVERLAP
+                self._seen = {attack_id: ended for attack_id, ended in self._seen.items() if ended >= horizon}
+
+            new_hits = [attack for attack in fresh if self._is_hit(attack)]
+            for attack in new_hits:
+                self._count(attack)
+            return new_hits
+
+    def _is_hit(self, attack):
+        # An outgoing attack that counted towards the chain (it gained respect or a chain number)
+        if attack.get("attacker_faction") != self.faction_id:
+            return False
+        return bool(attack.get("chain") or attack.get("respect", attack.get("respect_gain", 0)))
+
+    def _count(self, attack):
+        member_id = attack.get("attacker_id")
+        name = attack.get("attacker_name") or str(member_id)
+        ended = _ended(attack)
+        tally = self.members.setdefault(member_id, {"member_id": member_id, "name": name, "hits": 0,
+                                                    "respect": 0.0, "last_hit": 0})
+        tally["name"] = name
+        tally["hits"] += 1
+        tally["respect"] += float(attack.get("respect", attack.get("respect_gain", 0)) or 0)
+        tally["last_hit"] = max(tally["last_hit"], ended)
+        self.hits += 1
+        if self.last_hit is None or ended >= self.last_hit[0]:
+            self.last_hit = (ended, name)
+
+    def snapshot(self):
+        """Per-member tallies, most hits first."""
+        with self._lock:
+            return sorted((dict(tally) for tally in self.members.values()),
+                          key=lambda tally: (-tally["hits"], -tally["last_hit"]))
+
+
+def _ended(attack):
+    return attack.get("timestamp_ended") or attack.get("timestamp_started", 0)
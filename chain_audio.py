@@ -0,0 +1,73 @@
+import logging
+
+import pygame
+
+
+log = logging.getLogger("chainwatch.audio")
+
+
+class AlarmAudio:
+    """Alarm and pre-alarm playback from sounds decoded once into memory.
+
+    Each sound file is decoded into a `pygame.mixer.Sound` on first use and kept,
+    and the alarm and pre-alarm play on their own reserved mixer channels.
+    Playback only changes when the alarm state (or the chosen file) changes, so
+    calling `set_state` every timer tick costs nothing and never restarts a loop.
+    """
+
+    ALARM_CHANNEL = 0
+    PRE_ALARM_CHANNEL = 1
+
+    def __init__(self, volume=0.5):
+        if not pygame.mixer.get_init():
+            pygame.mixer.init()
+        pygame.mixer.set_reserved(2)
+        self.alarm_channel = pygame.mixer.Channel(self.ALARM_CHANNEL)
+        self.pre_alarm_channel = pygame.mixer.Channel(self.PRE_ALARM_CHANNEL)
+        self.volume = volume
+        self.state = "off"
+        self._playing = None
+        self._sounds = {}
+
+    def sound(self, path):
+        """Return the decoded sound for `path`, loading it only the first time."""
+        if path not in self._sounds:
+            try:
+                self._sounds[path] = pygame.mixer.Sound(path)
+            except (pygame.error, FileNotFoundError) as e:
+                # Not cached, so a file that shows up later is picked up on the next transition
+                log.warning(f"Failed to load sound {path}: {e}")
+                return None
+        return self._sounds[path]
+
+    def preload(self, *paths):
+        for path in paths:
+            self.sound(path)
+
+    def set_state(self, state, alarm_path=None, pre_alarm_path=None):
+        """Switch between "alarm", "pre-alarm" and "off"; a no-op if nothing changed."""
+        path = alarm_path if state == "alarm" else pre_alarm_path if state == "pre-alarm" else None
+        if (state, path) == self._playing:
+            return
+        self._playing = (state, path)
+        self.state = state
+
+        self.alarm_channel.stop()
+        self.pre_alarm_channel.stop()
+        if state == "off":
+            return
+
+        sound = self.sound(path)
+        if sound is not None:
+            channel = self.alarm_channel if state == "alarm" else self.pre_alarm_channel
+            channel.set_volume(self.volume)
+            channel.play(sound, loops=-1)  # Loop indefinitely
+
+    def set_volume(self, volume):
+        """Apply a new volume to whatever is playing, without reloading it."""
+        self.volume = volume
+        self.alarm_channel.set_volume(volume)
+        self.pre_alarm_channel.set_volume(volume)
+
+    def stop(self):
+        self.set_state("off")
@@ -0,0 +1,75 @@
+import collections
+import math
+import threading
+import time
+
+
+class ServerClock:
+    """Estimate Torn server time from a local monotonic clock.
+
+    Every poll gives one sample: the server stamped its (whole-second) timestamp
+    somewhere between sending the request and receiving the reply, which bounds
+    the offset between server time and the local clock to an interval. The
+    intersection of recent intervals is the current estimate and its half-width
+    the uncertainty, so a few polls narrow the band well below the round trip.
+    """
+
+    def __init__(self, window=20, monotonic=time.perf_counter, wall=time.time):
+        self.window = window
+        self.monotonic = monotonic  # Swappable for a virtual clock in simulations
+        self.wall = wall
+        self._samples = collections.deque(maxlen=window)
+        # Until the first sample, fall back to the local wall clock
+        self.offset = wall() - monotonic()
+        self.uncertainty = None
+        self._lock = threading.Lock()
+
+    @property
+    def synced(self):
+        return self.uncertainty is not None
+
+    def now(self):
+        """Current server epoch time in seconds (fractional)."""
+        return self.monotonic() + self.offset
+
+    def add_sample(self, server_timestamp, sent, received, resolution=1.0):
+        """Add one poll: a whole-second server timestamp and its local send/receive times.
+
+        `sent` and `received` are readings of the monotonic clock (`time.perf_counter()`).
+        A timestamp known to within some other window than a whole second (another
+        watcher's estimate, say) passes the window's start and its `resolution`.
+        """
+        sample = (server_timestamp - received, server_timestamp + resolution - sent)
+        with self._lock:
+            self._samples.append(sample)
+            low = max(bound[0] for bound in self._samples)
+            high = min(bound[1] for bound in self._samples)
+            if low > high:
+                # Samples disagree (server clock stepped or the local clock was suspended),
+                # start over from the newest sample
+                self._samples.clear()
+                self._samples.append(sample)
+                low, high = sample
+
+            self.offset = (low + high) / 2
+            self.uncertainty = (high - low) / 2
+
+    def set_local_offset(self, offset):
+        """Assume the server runs `offset` seconds ahead of the wall clock until the first sample."""
+        with self._lock:
+            if not self._samples:
+                self.offset = self.wall() + offset - self.monotonic()
+
+    def time_to_next_second(self):
+        """Seconds until the server clock reaches its next whole second."""
+        server_now = self.now()
+        return math.floor(server_now) + 1 - server_now
+
+    def local_offset(self):
+        """Seconds the server clock runs ahead of the local wall clock."""
+        return self.now() - self.wall()
+
+    def describe(self):
+        if not self.synced:
+            return "Server Clock: not synced"
+        return f"Server Clock: {self.local_offset():+.2f}s ±{self.uncertainty:.2f}s"
@@ -0,0 +1,97 @@
+import json
+import os
+
+
+# Directory for storing settings and sounds
+DATA_FOLDER = "chainwatch_data"
+
+API_BASE_URL = "https://api.torn.com"
+
+# Alarm sounds paths (You can add your own paths to sounds here)
+ALARM_SOUNDS = [
+    os.path.join(DATA_FOLDER, "mixkit-classic-alarm-995.wav"),  # Default alarm sound
+    "Search File"
+]
+
+PRE_ALARM_SOUNDS = [
+    os.path.join(DATA_FOLDER, "mixkit-retro-game-emergency-alarm-1000.wav"),  # Default pre-alarm sound
+    "Search File"
+]
+
+# URLs for downloading default alarm sounds
+ALARM_SOUNDS_URLS = {
+    os.path.join(DATA_FOLDER, "mixkit-classic-alarm-995.wav"): "https://assets.mixkit.co/active_storage/sfx/995/995.wav",
+    os.path.join(DATA_FOLDER, "mixkit-retro-game-emergency-alarm-1000.wav"): "https://assets.mixkit.co/active_storage/sfx/1000/1000.wav"
+}
+
+# Expected SHA-256 of what each default URL serves; a download that differs is refused.
+# A URL without a digest here (None, or one you add yourself) is trusted as first downloaded.
+ALARM_SOUNDS_SHA256 = {
+    "https://assets.mixkit.co/active_storage/sfx/995/995.wav": None,
+    "https://assets.mixkit.co/active_storage/sfx/1000/1000.wav": None,
+}
+
+SETTINGS_FILE = os.path.join(DATA_FOLDER, "chain_watcher_settings.json")
+
+# Every setting the watcher understands, with its default
+DEFAULT_SETTINGS = {
+    "api_interval": 5,  # API call interval in seconds
+    "panic_interval": 2,  # API call interval while in panic mode
+    "max_api_interval": 30,  # Longest API call interval while the chain is safe
+    "alarm_trigger_seconds": 60,  # Alarm trigger threshold in seconds
+    "pre_alarm_trigger_seconds": 90,  # Pre-Alarm trigger threshold in seconds
+    "alarm_volume": 0.5,
+    "alarm_sound_choice": ALARM_SOUNDS[0],
+    "pre_alarm_sound_choice": PRE_ALARM_SOUNDS[0],
+    "api_key": "",  # API Keys, comma-separated
+    "prevent_sleep": False,
+    "keep_on_top": False,
+    "backup_timer_enabled": False,
+    "watch_factions": "",  # Extra faction IDs watched side by side
+    "faction_id": "",  # Faction to watch, empty for your own
+    "forecast_pre_alarm_risk": 0.5,  # Break probability that sounds the pre-alarm early, 0 for off
+    "forecast_lead_seconds": 180,  # Earliest a forecast pre-alarm may sound, in seconds left
+    "track_attacks": False,  # Fetch the attack log with the chain (own faction, needs faction API access)
+    "hedge_requests": False,  # In panic mode, race a second request against a slow one
+    "notify_desktop": False,  # Desktop notifications for alarms
+    "notify_webhook": "",  # Webhook URL (Discord, Slack, ...) to post alarms to
+    "notify_script": "",  # Command to run for every alarm, with the details on stdin
+    "notify_rate_per_minute": 6,  # Most notifications each of those sends per minute
+    "record_history": True,  # Record every poll to the chain history file
+    "metrics_port": 0,  # Local port for Prometheus metrics, 0 for off
+    "fanout_publish": "",  # "HOST:PORT" to push the chain to other watchers on the LAN
+    "fanout_subscribe": "",  # Publisher URL to take the chain from instead of polling
+    "resume_on_launch": True,  # Keep the chain state on disk and pick the countdown up again after a restart
+    "debug": False,
+}
+
+
+def ensure_data_folder():
+    if not os.path.exists(DATA_FOLDER):
+        os.makedirs(DATA_FOLDER)
+
+
+def load_settings(path=SETTINGS_FILE):
+    """Return the saved settings merged over the defaults."""
+    settings = dict(DEFAULT_SETTINGS)
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            settings.update(json.load(f))
+    return settings
+
+
+def write_json_atomic(path, data):
+    """Write `data` as JSON through a temporary file, so a crash never leaves half a file."""
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    temporary = path + ".tmp"
+    with open(temporary, 'w') as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+
+def save_settings(settings, path=SETTINGS_FILE):
+    write_json_atomic(path, settings)
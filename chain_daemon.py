@@ -0,0 +1,197 @@
+import json
+import signal
+import socket
+import sys
+import threading
+
+from chain_config import API_BASE_URL, SETTINGS_FILE, load_settings
+
+
+class StdoutEventSink:
+    """Write engine events to stdout as JSON lines."""
+
+    def __init__(self, stream=None):
+        self.stream = stream if stream is not None else sys.stdout
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        line = json.dumps(event, default=str)
+        with self._lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+    def close(self):
+        pass
+
+
+class SocketEventSink:
+    """Broadcast engine events as JSON lines to every client connected to a TCP port.
+
+    A client that cannot keep up is dropped rather than allowed to stall the engine.
+    """
+
+    def __init__(self, host, port):
+        self.server = socket.create_server((host, port), reuse_port=False)
+        self.clients = []
+        self._lock = threading.Lock()
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+
+    def _accept_loop(self):
+        while True:
+            try:
+                client, _address = self.server.accept()
+            except OSError:
+                return
+            client.settimeout(0.5)
+            with self._lock:
+                self.clients.append(client)
+
+    def __call__(self, event):
+        data = (json.dumps(event, default=str) + "\n").encode()
+        with self._lock:
+            for client in list(self.clients):
+                try:
+                    client.sendall(data)
+                except OSError:
+                    self.clients.remove(client)
+                    client.close()
+
+    def close(self):
+        self.server.close()
+        with self._lock:
+            for client in self.clients:
+                client.close()
+            self.clients = []
+
+
+def _without_ticks(sink):
+    # Drops the high-frequency events: countdown ticks and polls that changed nothing
+    def listener(event):
+        if event["type"] not in ("tick", "poll_unchanged"):
+            sink(event)
+    return listener
+
+
+def make_event_sink(target):
+    """Build a sink from "stdout" or "tcp:HOST:PORT"."""
+    if target == "stdout":
+        return StdoutEventSink()
+    if target.startswith("tcp:"):
+        host, _, port = target[len("tcp:"):].rpartition(":")
+        return SocketEventSink(host or "127.0.0.1", int(port))
+    raise ValueError(f"Unknown event target: {target}")
+
+
+def add_daemon_arguments(parser):
+    parser.add_argument("--config", default=SETTINGS_FILE,
+                        help="JSON settings file (default: %(default)s)")
+    parser.add_argument("--api-key", help="API key(s), comma-separated; overrides the settings file")
+    parser.add_argument("--faction-id", help="Faction to watch instead of your own")
+    parser.add_argument("--watch-factions", help="Extra faction IDs to watch, comma-separated")
+    parser.add_argument("--events", action="append", default=None,
+                        help='Where to emit events: "stdout" or "tcp:HOST:PORT" (repeatable, default: stdout)')
+    parser.add_argument("--tick-events", action="store_true",
+                        help="Also emit the once-per-second countdown ticks and polls that changed nothing")
+    parser.add_argument("--sound", action="store_true", help="Play the alarm sounds (needs pygame)")
+    parser.add_argument("--notify-desktop", action="store_true", help="Show desktop notifications for alarms")
+    parser.add_argument("--notify-webhook", metavar="URL", help="Post alarms to this webhook (Discord, Slack, ...)")
+    parser.add_argument("--notify-script", metavar="COMMAND", help="Run this command for every alarm")
+    parser.add_argument("--metrics-port", type=int,
+                        help="Serve Prometheus metrics on this local port; overrides the settings file")
+    parser.add_argument("--publish", metavar="[HOST:]PORT",
+                        help="Push the chain to other watchers (Server-Sent Events); binds to loopback unless HOST is given")
+    parser.add_argument("--subscribe", metavar="URL",
+                        help="Take the chain from a publisher, e.g. http://192.168.1.10:8765, polling only if it goes silent")
+    parser.add_argument("--debug", action="store_true", help="Print debug output to stderr")
+    parser.add_argument("--api-url", default=API_BASE_URL,
+                        help="Torn API base URL, e.g. a local stand-in server (default: %(default)s)")
+
+
+def run_daemon(args):
+    """Run the engine without any GUI until SIGINT or SIGTERM."""
+    # Imported here so building the command line parser stays cheap
+    from chain_engine import ChainEngine
+    from chain_log import setup_logging, shutdown_logging
+    from chain_snapshot import StateSnapshot, load_state
+    from torn_api import TornApiClient
+
+    settings = load_settings(args.config)
+    if args.api_key is not None:
+        settings["api_key"] = args.api_key
+    if args.faction_id is not None:
+        settings["faction_id"] = args.faction_id
+    if args.watch_factions is not None:
+        settings["watch_factions"] = args.watch_factions
+    if args.metrics_port is not None:
+        settings["metrics_port"] = args.metrics_port
+    if args.publish is not None:
+        settings["fanout_publish"] = args.publish
+    if args.subscribe is not None:
+        settings["fanout_subscribe"] = args.subscribe
+    if args.notify_desktop:
+        settings["notify_desktop"] = True
+    if args.notify_webhook is not None:
+        settings["notify_webhook"] = args.notify_webhook
+    if args.notify_script is not None:
+        settings["notify_script"] = args.notify_script
+    if args.debug:
+        settings["debug"] = True
+
+    # Log lines go to stderr and a rotating JSON file, written off the engine's threads
+    setup_logging(debug=settings["debug"])
+    engine = ChainEngine(settings, TornApiClient(base_url=args.api_url, pool_size=8))
+    state_snapshot = None
+    if settings["resume_on_launch"]:
+        # Count down from the saved chain of the same faction until the first poll answers
+        state = load_state()
+        if state is not None and state.get("faction_id", "") == settings["faction_id"]:
+            engine.restore(state)
+        state_snapshot = StateSnapshot(engine)
+        engine.subscribe(state_snapshot)
+    sinks = [make_event_sink(target) for target in (args.events or ["stdout"])]
+    for sink in sinks:
+        engine.subscribe(sink if args.tick_events else _without_ticks(sink))
+    audio = None
+    if args.sound:
+        from chain_assets import AssetCache
+        from chain_audio import AlarmAudio
+        # Fetch missing default sounds in the background; they load on first use
+        AssetCache().start()
+        audio = AlarmAudio(settings["alarm_volume"])
+        audio.preload(settings["alarm_sound_choice"], settings["pre_alarm_sound_choice"])
+    # Sounds, desktop notifications, webhooks and scripts each get their own worker
+    from chain_notify import start_notifications
+    notifications = start_notifications(engine, engine.settings, audio=audio)
+    metrics_server = None
+    if settings["metrics_port"]:
+        from chain_metrics import start_metrics
+        metrics_server = start_metrics(engine, settings["metrics_port"])
+    fanout = []
+    if settings["fanout_publish"] or settings["fanout_subscribe"]:
+        from chain_fanout import start_fanout
+        fanout = start_fanout(engine, settings)
+
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    # With --debug, `kill -USR1 <pid>` writes the profile to the data folder (`kill -USR2` first to trace allocations)
+    from chain_profile import install_dump_signal
+    install_dump_signal()
+
+    engine.start()
+    try:
+        while not stop.is_set():
+            stop.wait(1)
+    finally:
+        engine.stop()
+        for sink in sinks:
+            sink.close()
+        notifications.close()
+        if state_snapshot is not None:
+            state_snapshot.close()
+        if metrics_server is not None:
+            metrics_server.close()
+        for endpoint in fanout:
+            endpoint.close()
+        shutdown_logging()
+    return 0
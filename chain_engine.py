@@ -0,0 +1,476 @@
+import logging
+import math
+import struct
+import threading
+import time
+
+import requests
+
+from chain_attacks import AttackLog
+from chain_clock import ServerClock
+from chain_config import DEFAULT_SETTINGS
+from chain_forecast import HitRateForecast
+from chain_history import ERROR_HTTP, ERROR_NONE, ERROR_TORN_UNKNOWN, ERROR_TRANSPORT, ChainHistory
+from chain_log import register_secrets, set_debug
+from chain_multi import MultiChainWatcher, parse_faction_ids
+from chain_power import get_sleep_inhibitor
+from chain_profile import get_profiler
+from chain_retry import Backoff, CircuitBreaker
+from chain_scheduler import PollScheduler
+from torn_api import (KEY_QUARANTINE_SECONDS, RATE_LIMIT_QUARANTINE_SECONDS, TornApiClient, TornApiError,
+                      classify_error, parse_api_keys)
+
+
+log = logging.getLogger("chainwatch.engine")
+
+
+class ChainEngine:
+    """GUI-free chain watcher: polling, server-synced countdown and alarm decisions.
+
+    The engine runs two threads, `watch_chain` polling the API and
+    `update_timer_loop` ticking the countdown, and reports everything it does as
+    event dicts to the listeners registered with `subscribe`. Listeners run on
+    the engine's threads and must not block; the Tk app and the headless daemon
+    are both just listeners.
+
+    Events (the "type" key):
+      started / stopped
+      poll          successful poll that changed the chain, with its timing and next interval
+      poll_unchanged  successful poll that found the chain as before (timing and interval only)
+      poll_failed   failed poll with the error (Torn `code` / HTTP `status` if any), its class and the retry interval
+      circuit       the API kept failing and polling paused ("open"), or it answered again ("closed")
+      tick          once per server second with the countdown and diagnostics
+      alarm         alarm state change of the main chain ("off", "pre-alarm", "alarm"), with the break risk
+      target_alarm  alarm state change of an extra faction in `watch_factions`
+      upstream      a fan-out publisher went "live" or "silent"
+      upstream_update  chain state pushed by the publisher that changed the chain (not a poll: no timing)
+      hits          new chain hits by faction members, from the attack log (`track_attacks`)
+
+    `client` and `clock` (a callable returning seconds, standing in for both the
+    monotonic and the wall clock) can be replaced, which is how `chain_sim`
+    replays a chain trace through the real logic on virtual time.
+    """
+
+    def __init__(self, settings=None, client=None, history=None, clock=None):
+        self.settings = dict(DEFAULT_SETTINGS)
+        if settings:
+            self.settings.update(settings)
+        self.api_client = client if client is not None else TornApiClient(pool_size=8)
+        self.history = history if history is not None else ChainHistory()  # Every poll, for later analysis
+        # Local monotonic clock synced to the Torn server; `clock` swaps in a virtual one
+        self.server_clock = ServerClock(monotonic=clock, wall=clock) if clock is not None else ServerClock()
+        self.forecast = HitRateForecast()  # Hit rate and the chance the chain breaks before the next hit
+        self.poll_scheduler = PollScheduler(forecast=self.forecast)  # Picks the next poll time from the chain timeout
+        self.backoff = Backoff()  # Spaces out retries while polls keep failing
+        # Pauses polling through an outage; the countdown and backup timer carry on meanwhile
+        self.breaker = CircuitBreaker(clock=clock) if clock is not None else CircuitBreaker()
+        self.multi_watcher = MultiChainWatcher(self.api_client, self.server_clock)
+        self.attack_log = AttackLog()  # Who is hitting, read with the chain when `track_attacks` is on
+        self.own_faction_id = None  # Your faction's ID, from the first reply that names it
+        self.remaining_seconds = 0
+        self.break_risk = 0.0
+        self._early_warning_end = None  # `chain_end_time` a forecast pre-alarm was raised for
+        self.backup_remaining_seconds = 0  # Initialize backup timer countdown
+        self.chain_end_time = 0
+        self.chain = {}
+        self.running = False
+        self.panic_mode = False  # Track if we are in panic mode
+        self.alarm_state = "off"
+        self.target_states = {}
+        self._chain_key = None  # (current, end) of the last chain pushed to listeners
+        self._chain_lock = threading.Lock()
+        self.upstream = None  # Fan-out subscriber feeding chain states from another watcher
+        self.stop_event = threading.Event()  # Wakes the loops from long sleeps on stop
+        self.sleep_inhibitor = get_sleep_inhibitor()  # Held from start to stop while `prevent_sleep` is on
+        self.profiler = get_profiler()  # Spans and stack samples while `debug` is on
+        self._listeners = []
+        self._watched_faction_ids = None
+        self.update_settings()
+
+    def subscribe(self, listener):
+        """Call `listener(event)` for every engine event."""
+        self._listeners.append(listener)
+
+    def emit(self, event_type, **fields):
+        event = {"type": event_type, "time": self.server_clock.now()}
+        event.update(fields)
+        for listener in list(self._listeners):
+            try:
+                listener(event)
+            except Exception as e:
+                # A broken listener must never stop the poller or the countdown
+                log.exception(f"Event listener failed on {event_type}: {e}")
+
+    def update_settings(self, values=None):
+        """Apply changed settings; safe to call while the engine runs."""
+        if values:
+            self.settings.update(values)
+        settings = self.settings
+        api_keys = parse_api_keys(settings["api_key"])
+        self.api_client.key_pool.set_keys(api_keys)
+        register_secrets(*api_keys)  # Never written to the log, whatever message they turn up in
+        set_debug(settings["debug"])
+
+        scheduler = self.poll_scheduler
+        scheduler.api_interval = settings["api_interval"]
+        scheduler.panic_interval = settings["panic_interval"]
+        scheduler.max_interval = settings["max_api_interval"]
+        scheduler.alarm_trigger_seconds = settings["alarm_trigger_seconds"]
+        scheduler.pre_alarm_trigger_seconds = settings["pre_alarm_trigger_seconds"]
+        self.backoff.base = settings["panic_interval"]
+        self.backoff.cap = settings["max_api_interval"]
+
+        watcher = self.multi_watcher
+        watcher.api_interval = settings["api_interval"]
+        watcher.panic_interval = settings["panic_interval"]
+        watcher.max_interval = settings["max_api_interval"]
+        watcher.alarm_trigger_seconds = settings["alarm_trigger_seconds"]
+        watcher.pre_alarm_trigger_seconds = settings["pre_alarm_trigger_seconds"]
+        self.profiler.set_enabled(settings["debug"])
+        if self.running:
+            self._update_targets()
+            self.sleep_inhibitor.set_enabled(settings["prevent_sleep"])
+
+    def _update_targets(self):
+        faction_ids = parse_faction_ids(self.settings["watch_factions"])
+        if faction_ids != self._watched_faction_ids:
+            self._watched_faction_ids = faction_ids
+            self.multi_watcher.set_targets(faction_ids)
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.stop_event = threading.Event()
+        self._chain_key = None
+        self.forecast.reset()
+        # Tally the hits made from now on
+        self.attack_log.reset(since=self.server_clock.now(), faction_id=self.own_faction_id)
+        self.backoff.reset()
+        self.breaker.reset()
+        self.sleep_inhibitor.set_enabled(self.settings["prevent_sleep"])
+        self.emit("started")
+        # Start the API polling loop in one thread
+        threading.Thread(target=self.watch_chain, args=(self.stop_event,), daemon=True).start()
+        # Start the continuous timer countdown loop in another thread
+        threading.Thread(target=self.update_timer_loop, args=(self.stop_event,), daemon=True).start()
+        # Poll the extra factions from the shared asyncio loop
+        self.multi_watcher.start([])
+        self._update_targets()
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        self.stop_event.set()
+        self.panic_mode = False  # Reset panic mode on stop
+        self.multi_watcher.stop()
+        self.sleep_inhibitor.release()
+        self.history.close()
+        self._watched_faction_ids = None
+        self.target_states = {}
+        self.alarm_state = "off"
+        if self.breaker.state != CircuitBreaker.CLOSED:
+            self.breaker.reset()
+            self.emit("circuit", state="closed", retry_in=0.0, error=None)
+        self.emit("stopped")
+
+    def restore(self, state):
+        """Take in a saved chain state (see `chain_snapshot`) so the countdown runs before the first poll.
+
+        The server clock assumes the saved offset until its first sample, and the
+        first poll replaces the chain, whatever it holds. Returns the seconds left.
+        """
+        self.server_clock.set_local_offset(state.get("server_offset", 0.0))
+        end = state.get("chain_end_time", 0)
+        remaining = max(0, math.floor(end - self.server_clock.now()))
+        with self._chain_lock:
+            self._chain_key = None
+            self.chain_end_time = end
+            self.chain = {"current": state.get("current", 0), "max": state.get("max", 0), "end": end,
+                          "timeout": remaining}
+            self.backup_remaining_seconds = remaining
+        return remaining
+
+    def debug(self, message):
+        # Logged to stderr and the log file, so debug output never mixes with events written to stdout
+        log.debug(message)
+
+    def watch_chain(self, stop_event):
+        while self.running and not stop_event.is_set():
+            if self.upstream is not None and self.upstream.live():
+                # A fan-out publisher pushes the chain; only poll ourselves once it goes silent
+                stop_event.wait(1)
+                continue
+            interval = self.poll_once()
+            # Wait the interval before the next API call, waking early on stop
+            if self.upstream is None:
+                stop_event.wait(interval)
+            else:
+                # ...or as soon as a publisher starts pushing the chain
+                deadline = time.monotonic() + interval
+                while not stop_event.wait(min(1, max(0, deadline - time.monotonic()))):
+                    if time.monotonic() >= deadline or self.upstream is None or self.upstream.live():
+                        break
+
+    def poll_once(self):
+        """Poll the chain once and return the seconds to wait before the next poll."""
+        with self.profiler.span("poll"):
+            return self._poll_once()
+
+    def _poll_once(self):
+        settings = self.settings
+        if not self.breaker.allow():
+            # The API keeps failing: leave it alone until the breaker lets a probe through
+            return max(1.0, self.breaker.retry_in())
+
+        # Target faction (own faction when no Faction ID is given)
+        faction_id = settings["faction_id"] or None
+        self.debug(f"Attempting API call to URL: {self.api_client.chain_url(faction_id)}")
+
+        started = time.perf_counter()
+        try:
+            # Make the API call on the pooled session; below the alarm threshold a slow
+            # reply may be raced by a second request when hedging is on
+            hedge = settings["hedge_requests"] and self.panic_mode
+            # The attack log comes in the same request; Torn only shows it for your own faction
+            track_attacks = settings["track_attacks"] and faction_id is None
+            extra_selections = ()
+            if track_attacks:
+                # The log doesn't say which side is ours: the basics name the faction until it is known
+                extra_selections = ("attacks",) if self.attack_log.faction_id is not None else ("attacks", "basic")
+            data, timing = self.api_client.get_chain(
+                faction_id, hedge=hedge, extra_selections=extra_selections,
+                since=self.attack_log.request_from() if track_attacks else None)
+            chain = data["chain"]
+        except Exception as e:
+            # Log the error and retry according to its kind
+            code = e.code if isinstance(e, TornApiError) else None
+            status = e.response.status_code if isinstance(e, requests.HTTPError) and e.response is not None else None
+            latency = time.perf_counter() - started
+            if code is None:
+                error = ERROR_HTTP if status else ERROR_TRANSPORT
+            else:
+                error = ERROR_TORN_UNKNOWN if code == ERROR_NONE else code
+            self.record_poll(error=error, latency=latency)
+            error_class = classify_error(e)
+            log.warning(f"API request failed: {e}", extra={"code": code, "status": status, "error_class": error_class})
+            interval = self.retry_delay(error_class, e)
+            self._chain_key = None  # Push the next good poll, whatever it holds
+            self.emit("poll_failed", error=str(e), code=code, status=status, error_class=error_class,
+                      latency=latency, interval=interval)
+            if error_class in ("temporary", "rate_limit"):
+                if self.breaker.record_failure():
+                    interval = self.breaker.retry_in()
+                    self.emit("circuit", state="open", retry_in=interval, error=str(e))
+            elif self.breaker.state == CircuitBreaker.HALF_OPEN:
+                if error_class == "budget":
+                    # No request went out: the next poll probes again
+                    self.breaker.release()
+                elif self.breaker.record_success():
+                    # Torn answered, if only to refuse the key or request: it is up again
+                    self.emit("circuit", state="closed", retry_in=0.0, error=None)
+            return interval
+
+        self.backoff.reset()
+        if self.breaker.record_success():
+            self.emit("circuit", state="closed", retry_in=0.0, error=None)
+
+        # Sync to the server clock, then take the chain as the server reports it
+        if timing.server_time is not None:
+            self.server_clock.add_sample(timing.server_time, timing.sent, timing.received)
+        interval = self.apply_chain(chain, timing)
+        if track_attacks:
+            if self.attack_log.faction_id is None and data.get("ID"):
+                self.own_faction_id = int(data["ID"])
+                self.attack_log.set_faction(self.own_faction_id)
+            self.apply_attacks(data.get("attacks"))
+        return interval
+
+    def apply_attacks(self, attacks):
+        """Tally the new hits in an `attacks` selection and let them move the countdown."""
+        new_hits = self.attack_log.update(attacks)
+        if not new_hits:
+            return
+        latest = max(hit.get("timestamp_ended") or hit.get("timestamp_started", 0) for hit in new_hits)
+        full_timeout = self.forecast.full_timeout
+        with self._chain_lock:
+            # The attack log can be ahead of the cached chain selection: a hit restarts the timer
+            if full_timeout and self.chain_end_time > self.server_clock.now() and latest + full_timeout > self.chain_end_time:
+                self.debug(f"Attack log moved the chain end by {latest + full_timeout - self.chain_end_time:.0f}s")
+                self.chain_end_time = latest + full_timeout
+        self.emit("hits", hits=[{"member_id": hit.get("attacker_id"), "name": hit.get("attacker_name"),
+                                 "time": hit.get("timestamp_ended") or hit.get("timestamp_started"),
+                                 "respect": hit.get("respect", hit.get("respect_gain", 0))} for hit in new_hits],
+                  total=self.attack_log.hits)
+
+    def retry_delay(self, error_class, error):
+        """Seconds to wait after a failed poll, by the kind of failure (see `classify_error`)."""
+        settings = self.settings
+        key_pool = self.api_client.key_pool
+        api_key = getattr(error, "api_key", None)
+        if error_class == "key" and api_key:
+            key_pool.quarantine(api_key, KEY_QUARANTINE_SECONDS)
+            self.debug(f"API key ...{api_key[-4:]} refused, left out for {KEY_QUARANTINE_SECONDS}s")
+        elif error_class == "rate_limit" and api_key:
+            key_pool.quarantine(api_key, RATE_LIMIT_QUARANTINE_SECONDS)
+
+        if error_class == "temporary":
+            return self.backoff.next_delay()
+        if error_class == "request":
+            # A wrong faction ID or selection stays wrong until the settings change
+            return settings["max_api_interval"]
+        # Key, rate limit and budget trouble: wait for the next usable key, but check back
+        # within the idle interval in case new keys are entered meanwhile
+        wait = key_pool.time_until_available()
+        if error_class == "rate_limit":
+            wait = max(wait or 0.0, self.backoff.next_delay())
+        if wait is None:
+            return settings["max_api_interval"]
+        return min(settings["max_api_interval"], max(settings["panic_interval"], wait))
+
+    def apply_chain(self, chain, timing, source="poll"):
+        """Take in one chain state, polled or pushed by a publisher; returns the next poll interval.
+
+        `source` is "poll" for our own API calls and "fanout" for states pushed by
+        a publisher, which are neither recorded nor reported as polls.
+        """
+        with self._chain_lock, self.profiler.span("state update"):
+            return self._apply_chain(chain, timing, source)
+
+    def _apply_chain(self, chain, timing, source):
+        settings = self.settings
+        scheduler = self.poll_scheduler
+
+        # `timeout` only counts down towards `end`, so `current` and `end` tell a change
+        chain_key = (chain["current"], chain["end"])
+        changed = chain_key != self._chain_key
+        if changed:
+            self._chain_key = chain_key
+            self.chain = chain
+            self.chain_end_time = chain["end"]
+        if source == "poll":
+            self.record_poll(chain, latency=timing.total)
+
+        # Set the backup timer timeout; it also stands in while the API is down
+        self.backup_remaining_seconds = chain["timeout"]
+
+        # Enter panic mode if remaining time is below alarm threshold;
+        # `timeout` is measured on the server so local clock skew doesn't matter
+        remaining = chain["timeout"]
+        panic_mode = 0 < remaining <= settings["alarm_trigger_seconds"]
+        changed = changed or panic_mode != self.panic_mode
+        self.panic_mode = panic_mode
+
+        # Schedule the next poll from the timeout, hit rate and key budget
+        scheduler.observe(chain["current"], self.server_clock.now(), chain["timeout"])
+        key_pool = self.api_client.key_pool
+        interval = scheduler.next_interval(remaining, key_pool.remaining_budget(), key_pool.budget_per_minute())
+
+        if source != "poll":
+            # No request of ours went out: nothing to time, record or count as a poll
+            if changed:
+                self.debug("Publisher pushed a new chain end time.")
+                self.emit("upstream_update", chain=chain, interval=interval, panic_mode=self.panic_mode)
+            return interval
+
+        # Log success in debug mode
+        self.debug("API call successful: Chain end time updated." if changed else "API call successful: No change.")
+        self.debug(f"API timing: {timing.describe()}")
+        if timing.hedged:
+            self.debug(self.api_client.hedge_stats.describe())
+        self.debug(f"API budget: {key_pool.remaining_budget()} requests left")
+        self.debug(self.server_clock.describe())
+        self.debug(f"Next API call in {interval:.1f}s ({self.forecast.describe()})")
+
+        # Only a changed chain goes out in full; listeners that just count polls get the rest
+        if changed:
+            self.emit("poll", chain=chain, timing=timing.as_dict(), interval=interval,
+                      panic_mode=self.panic_mode)
+        else:
+            self.emit("poll_unchanged", timing=timing.as_dict(), interval=interval)
+        return interval
+
+    def record_poll(self, chain=None, latency=0.0, error=ERROR_NONE):
+        """Append the poll to the history file, if recording is enabled."""
+        if not self.settings["record_history"]:
+            return
+        chain = chain or {}
+        try:
+            self.history.append(self.server_clock.now(),
+                                current=chain.get("current", 0),
+                                maximum=chain.get("max", 0),
+                                timeout=chain.get("timeout", 0),
+                                modifier=chain.get("modifier", 0.0),
+                                cooldown=chain.get("cooldown", 0),
+                                latency=(latency or 0.0) * 1000,
+                                error=error)
+        except (OSError, struct.error) as e:
+            # A full disk or odd API value must never stop the watcher
+            self.debug(f"Failed to record chain history: {e}")
+
+    def update_timer_loop(self, stop_event):
+        while self.running and not stop_event.is_set():
+            self.tick()
+            # Sleep on the monotonic clock until the next whole server second, so ticks
+            # neither drift nor jitter (a few ms late to land safely past the boundary)
+            stop_event.wait(self.server_clock.time_to_next_second() + 0.005)
+
+    def tick(self):
+        """Advance the countdown by one server second and decide the alarm state."""
+        with self.profiler.span("tick"):
+            self._tick()
+
+    def _tick(self):
+        settings = self.settings
+
+        # Calculate main remaining time based on `chain_end_time` and the server clock
+        self.remaining_seconds = max(0, math.floor(self.chain_end_time - self.server_clock.now()))
+
+        # Decrement backup timer; shown when enabled, or while the breaker holds polling off
+        self.backup_remaining_seconds = max(0, self.backup_remaining_seconds - 1)
+        degraded = self.breaker.state != CircuitBreaker.CLOSED
+        show_backup = settings["backup_timer_enabled"] or degraded
+
+        # Chance that nobody hits before the timer runs out, at the current hit rate
+        self.break_risk = self.forecast.break_probability(self.remaining_seconds)
+
+        # Handle alarm triggers for main timer; a likely break sounds the pre-alarm early
+        risk_threshold = settings["forecast_pre_alarm_risk"]
+        if 0 < self.remaining_seconds <= settings["alarm_trigger_seconds"]:
+            alarm_state = "alarm"
+        elif 0 < self.remaining_seconds <= settings["pre_alarm_trigger_seconds"]:
+            alarm_state = "pre-alarm"
+        elif (risk_threshold and 0 < self.remaining_seconds <= settings["forecast_lead_seconds"]
+                and (self.break_risk >= risk_threshold or self._early_warning_end == self.chain_end_time)):
+            # Once raised it holds until a hit moves the chain end, instead of flickering with the estimate
+            alarm_state = "pre-alarm"
+            self._early_warning_end = self.chain_end_time
+        else:
+            alarm_state = "off"
+        if alarm_state != self.alarm_state:
+            previous, self.alarm_state = self.alarm_state, alarm_state
+            self.emit("alarm", state=alarm_state, previous=previous, remaining=self.remaining_seconds,
+                      break_risk=self.break_risk)
+
+        # Alarm transitions of the extra factions
+        for row in self.multi_watcher.snapshot():
+            previous = self.target_states.get(row["faction_id"], "idle")
+            if row["state"] != previous:
+                self.target_states[row["faction_id"]] = row["state"]
+                self.emit("target_alarm", faction_id=row["faction_id"], state=row["state"],
+                          previous=previous, remaining=row["remaining"])
+
+        key_pool = self.api_client.key_pool
+        self.emit("tick",
+                  remaining=self.remaining_seconds,
+                  backup_remaining=self.backup_remaining_seconds if show_backup else None,
+                  degraded=degraded,
+                  alarm_state=self.alarm_state,
+                  break_risk=self.break_risk,
+                  hit_rate=self.forecast.rate * 60,
+                  budget_remaining=key_pool.remaining_budget(),
+                  budget_per_minute=key_pool.budget_per_minute(),
+                  clock_offset=self.server_clock.local_offset(),
+                  clock_uncertainty=self.server_clock.uncertainty,
+                  clock=self.server_clock.describe())
@@ -0,0 +1,228 @@
+import json
+import logging
+import math
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+import urllib3
+
+from torn_api import RequestTiming
+
+
+log = logging.getLogger("chainwatch.fanout")
+
+# Default port of the fan-out publisher
+FANOUT_PORT = 8765
+
+# The publisher repeats the latest state this often, so subscribers can tell it is alive
+HEARTBEAT_SECONDS = 5
+
+# A subscriber falls back to its own polling after this long without a message
+SILENCE_SECONDS = 15
+
+
+def parse_address(text, default_host="127.0.0.1"):
+    """Split "HOST:PORT", "PORT" or ":PORT" into a (host, port) tuple; the host defaults to loopback."""
+    host, _, port = str(text).rpartition(":")
+    return host or default_host, int(port) if port else FANOUT_PORT
+
+
+class _FanoutHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/events":
+            self.send_error(404)
+            return
+        # A Server-Sent Events stream, delimited by closing the connection
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        publisher = self.server.publisher
+        messages = publisher.add_client()
+        try:
+            message = publisher.latest_message()
+            while not publisher.closed:
+                if message is not None:
+                    self.wfile.write(message)
+                    self.wfile.flush()
+                try:
+                    message = messages.get(timeout=HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    message = publisher.latest_message()
+        except OSError:
+            pass
+        finally:
+            publisher.remove_client(messages)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FanoutPublisher:
+    """Push the engine's chain state to subscribers on the LAN as Server-Sent Events.
+
+    Every changed poll goes out at once and the latest state is repeated every
+    `HEARTBEAT_SECONDS`, together with the publisher's server clock estimate so
+    subscribers can sync their countdown without polling. Heartbeats stop while
+    the publisher's own polls are failing, which sends subscribers back to polling.
+
+    The stream is unauthenticated, so it only listens on loopback unless `host`
+    names the LAN address (or "0.0.0.0") to publish on.
+    """
+
+    def __init__(self, engine, port=FANOUT_PORT, host="127.0.0.1"):
+        self.engine = engine
+        self.closed = False
+        self._clients = []
+        self._lock = threading.Lock()
+        self._last_success = None
+        self.server = ThreadingHTTPServer((host, port), _FanoutHandler)
+        self.server.daemon_threads = True
+        self.server.publisher = self
+        engine.subscribe(self)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def address(self):
+        return self.server.server_address[:2]
+
+    def add_client(self):
+        messages = queue.Queue(maxsize=16)
+        with self._lock:
+            self._clients.append(messages)
+        return messages
+
+    def remove_client(self, messages):
+        with self._lock:
+            if messages in self._clients:
+                self._clients.remove(messages)
+
+    def latest_message(self):
+        """The current chain state as an SSE message, or None if it is not fresh."""
+        engine = self.engine
+        stale_after = 2 * engine.settings["max_api_interval"]
+        if (not engine.running or not engine.chain or self._last_success is None
+                or time.monotonic() - self._last_success > stale_after):
+            return None
+        server_now = engine.server_clock.now()
+        chain = dict(engine.chain)
+        if chain.get("end"):
+            # The stored timeout is from the last change; count it down to now
+            chain["timeout"] = max(0, math.floor(chain["end"] - server_now))
+        payload = {"chain": chain, "server_time": server_now, "uncertainty": engine.server_clock.uncertainty}
+        return f"event: chain\ndata: {json.dumps(payload)}\n\n".encode()
+
+    def __call__(self, event):
+        if event["type"] in ("poll", "poll_unchanged"):
+            self._last_success = time.monotonic()
+        if event["type"] != "poll":
+            return
+        message = self.latest_message()
+        with self._lock:
+            clients = list(self._clients)
+        for messages in clients:
+            try:
+                messages.put_nowait(message)
+            except queue.Full:
+                # The subscriber stopped reading; the next heartbeat catches it up
+                pass
+
+    def close(self):
+        self.closed = True
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FanoutSubscriber:
+    """Feed the engine from a `FanoutPublisher` instead of polling the API.
+
+    The engine keeps its own countdown and alarms; it only skips its polls while
+    messages keep arriving, and goes back to polling with its own key when the
+    publisher has been silent for `silence_timeout` seconds.
+    """
+
+    def __init__(self, engine, url, silence_timeout=SILENCE_SECONDS):
+        self.engine = engine
+        self.url = url.rstrip("/") + "/events" if not url.rstrip("/").endswith("/events") else url
+        self.silence_timeout = silence_timeout
+        self.closed = False
+        self._last_message = None
+        self._live = False
+        self._response = None
+        engine.upstream = self
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def live(self):
+        return (self._live and self._last_message is not None
+                and time.monotonic() - self._last_message < self.silence_timeout)
+
+    def _set_live(self, live):
+        if live != self._live:
+            self._live = live
+            self.engine.emit("upstream", state="live" if live else "silent", url=self.url)
+
+    def _run(self):
+        while not self.closed:
+            try:
+                self._listen()
+            except (requests.RequestException, urllib3.exceptions.HTTPError, OSError, ValueError) as e:
+                if not self.closed:
+                    self.engine.debug(f"Fan-out publisher {self.url} unavailable: {e}")
+            self._set_live(False)
+            if not self.closed:
+                time.sleep(2)
+
+    def _listen(self):
+        with requests.get(self.url, stream=True, timeout=(3.05, self.silence_timeout)) as response:
+            response.raise_for_status()
+            self._response = response
+            data = []
+            while not self.closed:
+                line = response.raw.readline()
+                if not line:
+                    return  # Publisher closed the stream
+                line = line.decode().rstrip("\r\n")
+                if line.startswith("data:"):
+                    data.append(line[len("data:"):].strip())
+                elif not line and data:
+                    self._handle(json.loads("\n".join(data)))
+                    data = []
+
+    def _handle(self, payload):
+        received = time.perf_counter()
+        self._last_message = time.monotonic()
+        self._set_live(True)
+        engine = self.engine
+        if not engine.running:
+            return
+        uncertainty = payload.get("uncertainty")
+        if uncertainty is not None:
+            # The publisher's estimate is good to +-uncertainty, and the LAN adds next to nothing
+            server_time = payload["server_time"]
+            engine.server_clock.add_sample(server_time - uncertainty, received, received, resolution=2 * uncertainty)
+        engine.apply_chain(payload["chain"], RequestTiming(), source="fanout")
+
+    def close(self):
+        self.closed = True
+        if self.engine.upstream is self:
+            self.engine.upstream = None
+        response = self._response
+        if response is not None:
+            try:
+                response.close()
+            except Exception as e:
+                log.debug(f"Closing fan-out stream failed: {e}")
+
+
+def start_fanout(engine, settings):
+    """Start the publisher and/or subscriber the settings ask for; returns them for closing."""
+    started = []
+    if settings["fanout_publish"]:
+        host, port = parse_address(settings["fanout_publish"])
+        started.append(FanoutPublisher(engine, port, host))
+    if settings["fanout_subscribe"]:
+        started.append(FanoutSubscriber(engine, settings["fanout_subscribe"]))
+    return started
@@ -0,0 +1,102 @@
+import math
+import time
+
+
+class HitRateForecast:
+    """Streaming estimate of the chain's hit rate and the risk that it breaks.
+
+    Hits are treated as a Poisson process whose rate has a gamma posterior:
+    every poll adds the hits since the last one to `alpha` and the elapsed time
+    to `beta`, after decaying both by `exp(-elapsed / window)` so old activity
+    fades out. That is O(1) per poll and gives the rate (`alpha / beta`) and its
+    variance (`alpha / beta**2`), and in closed form the chance that no hit lands
+    in the next `t` seconds, `(beta / (beta + t)) ** alpha`, which is the chance
+    the chain breaks when `t` is what is left on its timer.
+
+    The gaps between hits are tracked as well, by locating the last hit from the
+    `timeout` each poll reports (the timer restarts from its full length on a hit).
+    """
+
+    # Time constant (seconds) over which old hits stop counting
+    WINDOW = 300.0
+
+    # Prior: about one hit a minute, worth 30 seconds of watching
+    PRIOR_HITS = 0.5
+    PRIOR_SECONDS = 30.0
+
+    # Number of recent gaps the time-between-hits average mostly reflects
+    GAP_SAMPLES = 20
+
+    def __init__(self, window=WINDOW):
+        self.window = window
+        self.reset()
+
+    def reset(self):
+        self.alpha = self.PRIOR_HITS
+        self.beta = self.PRIOR_SECONDS
+        self.gap_mean = None  # Seconds between hits
+        self.gap_variance = 0.0
+        self.full_timeout = 0  # Longest timeout seen: what a hit resets the timer to
+        self.last_hit = None  # Estimated time of the latest hit
+        self._last_current = None
+        self._last_observed = None
+
+    @property
+    def rate(self):
+        """Expected hits per second."""
+        return self.alpha / self.beta
+
+    @property
+    def rate_variance(self):
+        return self.alpha / self.beta ** 2
+
+    def observe(self, current, timeout=None, now=None):
+        """Take in the chain's `current` count and `timeout` seen at time `now`."""
+        now = time.monotonic() if now is None else now
+        if self._last_current is not None and current < self._last_current:
+            # The chain broke and restarted; what came before says little about the new one
+            self.reset()
+        if self._last_current is not None and now > self._last_observed:
+            elapsed = now - self._last_observed
+            hits = current - self._last_current
+            decay = math.exp(-elapsed / self.window)
+            self.alpha = self.PRIOR_HITS + decay * (self.alpha - self.PRIOR_HITS) + hits
+            self.beta = self.PRIOR_SECONDS + decay * (self.beta - self.PRIOR_SECONDS) + elapsed
+            if hits > 0 and timeout is not None:
+                self._observe_gap(hits, timeout, now)
+        elif timeout is not None:
+            self.full_timeout = max(self.full_timeout, timeout)
+        self._last_current = current
+        self._last_observed = now
+
+    def _observe_gap(self, hits, timeout, now):
+        self.full_timeout = max(self.full_timeout, timeout)
+        last_hit = now - (self.full_timeout - timeout)
+        if self.last_hit is not None and last_hit > self.last_hit:
+            # Hits between two polls are taken as evenly spread over the stretch
+            gap = (last_hit - self.last_hit) / hits
+            weight = 1 - (1 - 1 / self.GAP_SAMPLES) ** hits
+            if self.gap_mean is None:
+                self.gap_mean = gap
+            else:
+                # Exponentially weighted mean and variance, updated in place
+                delta = gap - self.gap_mean
+                self.gap_mean += weight * delta
+                self.gap_variance = (1 - weight) * (self.gap_variance + weight * delta * delta)
+        self.last_hit = last_hit
+
+    def break_probability(self, remaining):
+        """Chance that no hit lands in the `remaining` seconds left on the timer."""
+        if remaining <= 0:
+            return 0.0
+        return (self.beta / (self.beta + remaining)) ** self.alpha
+
+    def expected_gap(self):
+        """Seconds until the next hit is expected, from the current rate."""
+        return 1 / self.rate
+
+    def describe(self):
+        text = f"Hit rate {self.rate * 60:.1f}/min (sd {math.sqrt(self.rate_variance) * 60:.1f})"
+        if self.gap_mean is not None:
+            text += f", {self.gap_mean:.0f}s between hits (sd {math.sqrt(self.gap_variance):.0f}s)"
+        return text
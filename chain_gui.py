@@ -0,0 +1,630 @@
+import tkinter as tk
+from tkinter import ttk, filedialog
+import logging
+import math
+import threading
+import time
+from datetime import datetime
+
+from chain_assets import AssetCache
+from chain_config import (ALARM_SOUNDS, PRE_ALARM_SOUNDS,
+                          ensure_data_folder, load_settings, save_settings)
+from chain_snapshot import StateSnapshot, load_state
+from chain_ui import UiUpdateQueue, FlashAnimation
+
+
+log = logging.getLogger("chainwatch.gui")
+
+# Window background for each alarm state of the main chain
+ALARM_COLORS = {"alarm": "red", "pre-alarm": "yellow"}
+
+
+class StartupTimer:
+    """Time spent in each start-up phase, for the debug output."""
+
+    def __init__(self, started=None):
+        self.started = started if started is not None else time.perf_counter()
+        self.last = self.started
+        self.phases = []
+        self._lock = threading.Lock()
+
+    def mark(self, phase):
+        """End `phase` now; phases marked this way follow each other on the main thread."""
+        now = time.perf_counter()
+        with self._lock:
+            self.phases.append((phase, now - self.last))
+            self.last = now
+
+    def add(self, phase, seconds):
+        """Record a phase that ran alongside the others, on a background thread."""
+        with self._lock:
+            self.phases.append((phase + " (background)", seconds))
+
+    def describe(self):
+        parts = ", ".join(f"{phase} {seconds * 1000:.0f}ms" for phase, seconds in self.phases)
+        return f"Startup {(time.perf_counter() - self.started) * 1000:.0f}ms: {parts}"
+
+
+class ChainWatcherApp:
+    def __init__(self, root, startup=None, debug=False):  # Ensure `self` is the first parameter
+        self.root = root
+        self.startup = startup if startup is not None else StartupTimer()
+        self.root.title("Chain Watcher App")
+        
+        self.api_interval = tk.IntVar(value=5)  # Default API call interval in seconds
+        self.panic_interval = tk.IntVar(value=2)  # API call interval while in panic mode
+        self.max_api_interval = tk.IntVar(value=30)  # Longest API call interval while the chain is safe
+        self.alarm_trigger_seconds = tk.IntVar(value=60)  # Alarm trigger threshold in seconds
+        self.pre_alarm_trigger_seconds = tk.IntVar(value=90)  # Pre-Alarm trigger threshold in seconds
+        self.alarm_volume = tk.DoubleVar(value=0.5)  # Volume control for alarm
+        self.alarm_sound_choice = tk.StringVar(value=ALARM_SOUNDS[0])
+        self.pre_alarm_sound_choice = tk.StringVar(value=PRE_ALARM_SOUNDS[0])
+        self.api_key = tk.StringVar()  # API Keys, comma-separated (no default value set in script)
+        self.prevent_sleep = tk.BooleanVar(value=False)  # Prevent PC from going to sleep
+        self.keep_on_top = tk.BooleanVar(value=False)  # Keep window on top of all others
+        self.backup_timer_enabled = tk.BooleanVar(value=False)  # Enable or disable backup timer
+        self.watch_factions = tk.StringVar()  # Extra faction IDs watched side by side
+        self.track_attacks = tk.BooleanVar(value=False)  # Read the attack log for a per-member hit tally
+        self.debug_mode = tk.BooleanVar(value=debug)  # Debug mode toggle
+        self.use_faction_id = tk.BooleanVar(value=False)
+        self.faction_id = tk.StringVar()
+
+        # Load previous settings
+        ensure_data_folder()
+        self.load_settings()
+        # The chain being watched when the app last closed or crashed is picked up again
+        self.resume_state = load_state() if self.file_settings["resume_on_launch"] else None
+        if self.resume_state is not None and not self.resume_state.get("watching"):
+            self.resume_state = None
+        self.startup.mark("settings")
+
+        # Engine and audio load in the background (see `load_modules`) so the window shows at once
+        self.engine = None
+        self.engine_loaded = False
+        self.audio = None
+        self.metrics_server = None
+        self.fanout = []
+        self.notifications = None
+        self.state_snapshot = None
+        self.start_requested = False
+        self.targets_refresh_job = None
+        self.settings_save_job = None
+
+        # GUI Setup
+        self.setup_gui()
+
+        # Worker threads publish widget state here; the Tk main loop draws it
+        self.ui_updates = UiUpdateQueue(self.root)
+        self.flash_animation = FlashAnimation(self.root)
+        self.default_bg = self.flash_animation.background
+        self.ui_updates.bind("time", lambda text: self.time_label.config(text=text))
+        self.ui_updates.bind("backup", lambda text: self.diagnostics_box.config(text=text))
+        self.ui_updates.bind("budget", lambda text: self.budget_label.config(text=text))
+        self.ui_updates.bind("clock", lambda text: self.clock_label.config(text=text))
+        self.ui_updates.bind("background", self.flash_animation.set_background)
+        self.ui_updates.bind("flash", self.flash_animation.flash)
+        self.ui_updates.bind("banner", self.show_banner)
+        self.ui_updates.bind("audio", self.refresh_sound)
+        self.flash_count = 0
+        self.ui_updates.start()
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
+        if self.resume_state is not None:
+            # Count down from the saved chain until the engine has loaded and takes over
+            if self.resume_state.get("faction_id"):
+                self.use_faction_id.set(True)
+                self.faction_id.set(self.resume_state["faction_id"])
+                self.toggle_faction_id()
+            self.start_requested = True
+            self.show_resumed_countdown()
+        self.startup.mark("window")
+
+        # Default alarm sounds download in the background; the banner reports progress
+        AssetCache().start(lambda state, message: self.ui_updates.publish("banner", message))
+        threading.Thread(target=self.load_modules, args=(self.alarm_volume.get(),), daemon=True).start()
+        self.root.after(10, self.finish_startup)
+
+    def load_modules(self, volume):
+        # Background thread: requests and pygame take longer to import than the window takes to draw
+        started = time.perf_counter()
+        import chain_engine  # noqa: F401 -- `finish_startup` builds the engine once this is loaded
+        self.startup.add("engine import", time.perf_counter() - started)
+        self.engine_loaded = True
+
+        started = time.perf_counter()
+        try:
+            from chain_audio import AlarmAudio
+            # Alarm sounds decoded once and played on dedicated mixer channels
+            audio = AlarmAudio(volume)
+        except Exception as e:
+            log.warning(f"Audio unavailable, alarms will be silent: {e}")
+            return
+        self.startup.add("audio", time.perf_counter() - started)
+        self.audio = audio
+        # An alarm already sounding (a resumed chain, an early Start) starts playing now
+        self.ui_updates.publish("audio", "ready")
+
+    def finish_startup(self):
+        if not self.engine_loaded:
+            self.root.after(10, self.finish_startup)
+            return
+        from chain_engine import ChainEngine
+
+        # GUI-free engine doing the polling, countdown and alarm decisions;
+        # every settings change in the window is pushed to it
+        self.engine = ChainEngine(dict(self.file_settings, **self.collect_settings()))
+        self.engine.subscribe(self.handle_engine_event)
+        if self.resume_state is not None:
+            self.engine.restore(self.resume_state)
+        if self.file_settings["resume_on_launch"]:
+            self.state_snapshot = StateSnapshot(self.engine)
+            self.engine.subscribe(self.state_snapshot)
+        # Sounds, desktop notifications and webhooks are delivered off the engine's threads
+        from chain_notify import start_notifications
+        self.notifications = start_notifications(self.engine, self.engine.settings, audio=lambda: self.audio)
+        self.metrics_server = None
+        if self.file_settings["metrics_port"]:
+            from chain_metrics import start_metrics
+            self.metrics_server = start_metrics(self.engine, self.file_settings["metrics_port"])
+        # One watcher can poll for the whole faction and push the chain to the others
+        self.fanout = []
+        if self.file_settings["fanout_publish"] or self.file_settings["fanout_subscribe"]:
+            from chain_fanout import start_fanout
+            self.fanout = start_fanout(self.engine, self.file_settings)
+        for variable in (self.api_interval, self.panic_interval, self.max_api_interval,
+                         self.alarm_trigger_seconds, self.pre_alarm_trigger_seconds, self.api_key,
+                         self.alarm_sound_choice, self.pre_alarm_sound_choice,
+                         self.prevent_sleep, self.backup_timer_enabled, self.watch_factions, self.track_attacks,
+                         self.debug_mode, self.use_faction_id, self.faction_id):
+            variable.trace_add("write", self.push_settings)
+        self.alarm_volume.trace_add("write", self.update_volume)
+        # A new sound file takes over at once, even in the middle of an alarm
+        self.alarm_sound_choice.trace_add("write", self.refresh_sound)
+        self.pre_alarm_sound_choice.trace_add("write", self.refresh_sound)
+        self.refresh_sound()
+        # Settings are saved a moment after every change, so a crash doesn't lose them
+        for variable in (self.api_interval, self.panic_interval, self.max_api_interval,
+                         self.alarm_trigger_seconds, self.pre_alarm_trigger_seconds, self.alarm_volume,
+                         self.alarm_sound_choice, self.pre_alarm_sound_choice, self.api_key, self.prevent_sleep,
+                         self.keep_on_top, self.backup_timer_enabled, self.watch_factions, self.track_attacks):
+            variable.trace_add("write", self.schedule_settings_save)
+        self.startup.mark("engine")
+
+        if self.start_requested:
+            self.start_watching()
+        self.debug_mode.trace_add("write", self.report_startup)
+        self.report_startup()
+
+    def report_startup(self, *args):
+        if self.debug_mode.get():
+            log.info(self.startup.describe())
+
+    def show_resumed_countdown(self):
+        # Tk timer standing in for the engine's ticks between launch and the resumed start
+        if self.engine is not None and self.engine.running:
+            return
+        state = self.resume_state
+        server_now = time.time() + state.get("server_offset", 0.0)
+        remaining = max(0, math.floor(state.get("chain_end_time", 0) - server_now))
+        minutes, seconds = divmod(remaining, 60)
+        self.ui_updates.publish("time", f"T-: {minutes:02}:{seconds:02}")
+        self.root.after(int((math.floor(server_now) + 1 - server_now) * 1000) + 5, self.show_resumed_countdown)
+
+    def schedule_settings_save(self, *args):
+        if self.settings_save_job is not None:
+            self.root.after_cancel(self.settings_save_job)
+        self.settings_save_job = self.root.after(1000, self.save_settings)
+
+    def close(self):
+        # Window closed: keep the settings and chain state (still watching, so it resumes next time)
+        self.save_settings()
+        if self.state_snapshot is not None:
+            self.state_snapshot.close()
+        self.root.destroy()
+
+    def show_banner(self, message):
+        # Non-modal notice above the timer; an empty message hides it
+        if message:
+            self.banner.config(text=message)
+            self.banner.pack(before=self.time_label, fill=tk.X)
+        else:
+            self.banner.pack_forget()
+
+    def refresh_sound(self, *args):
+        if self.notifications is None or "Search File" in (self.alarm_sound_choice.get(), self.pre_alarm_sound_choice.get()):
+            return
+        # Off the Tk thread: a newly chosen file is decoded on first play
+        threading.Thread(target=self.notifications.refresh, daemon=True).start()
+
+    def update_volume(self, *args):
+        if self.audio is not None:
+            try:
+                self.audio.set_volume(self.alarm_volume.get())
+            except tk.TclError:
+                pass
+
+    def setup_gui(self):
+        # Notices such as the sound download progress (hidden until there is one)
+        self.banner = tk.Label(self.root, text="", font=("Helvetica", 10), bg="#ffffcc")
+
+        # Time left label
+        self.time_label = tk.Label(self.root, text="T-: 00:00", font=("Helvetica", 60))
+        self.time_label.pack(pady=10)
+        
+        # Diagnostics box for backup timer
+        self.diagnostics_box = tk.Label(self.root, text="Backup Timer: Disabled", font=("Helvetica", 12))
+        self.diagnostics_box.pack(pady=5)
+
+        # Remaining API request budget across all keys
+        self.budget_label = tk.Label(self.root, text="API Budget: -", font=("Helvetica", 12))
+        self.budget_label.pack(pady=5)
+
+        # Estimated server clock offset and its confidence band
+        self.clock_label = tk.Label(self.root, text="Server Clock: not synced", font=("Helvetica", 12))
+        self.clock_label.pack(pady=5)
+        
+        # Volume control
+        volume_frame = tk.Frame(self.root)
+        volume_frame.pack(pady=5)
+        tk.Label(volume_frame, text="Volume:").pack(side=tk.LEFT)
+        volume_slider = ttk.Scale(volume_frame, from_=0, to=1, orient="horizontal", variable=self.alarm_volume)
+        volume_slider.pack(side=tk.LEFT)
+        
+        # Alarm trigger time field
+        trigger_frame = tk.Frame(self.root)
+        trigger_frame.pack(pady=5)
+        tk.Label(trigger_frame, text="Trigger at seconds left:").pack(side=tk.LEFT)
+        trigger_entry = ttk.Entry(trigger_frame, textvariable=self.alarm_trigger_seconds)
+        trigger_entry.pack(side=tk.LEFT)
+        
+        # Pre-Alarm trigger time field
+        pre_trigger_frame = tk.Frame(self.root)
+        pre_trigger_frame.pack(pady=5)
+        tk.Label(pre_trigger_frame, text="Pre-Alarm at seconds left:").pack(side=tk.LEFT)
+        pre_trigger_entry = ttk.Entry(pre_trigger_frame, textvariable=self.pre_alarm_trigger_seconds)
+        pre_trigger_entry.pack(side=tk.LEFT)
+        
+        # API interval field
+        interval_frame = tk.Frame(self.root)
+        interval_frame.pack(pady=5)
+        tk.Label(interval_frame, text="API Call Interval (seconds):").pack(side=tk.LEFT)
+        interval_entry = ttk.Entry(interval_frame, textvariable=self.api_interval)
+        interval_entry.pack(side=tk.LEFT)
+        
+        # Panic mode API interval field
+        panic_interval_frame = tk.Frame(self.root)
+        panic_interval_frame.pack(pady=5)
+        tk.Label(panic_interval_frame, text="Panic Mode API Interval (seconds):").pack(side=tk.LEFT)
+        panic_interval_entry = ttk.Entry(panic_interval_frame, textvariable=self.panic_interval)
+        panic_interval_entry.pack(side=tk.LEFT)
+
+        # Longest API interval while the chain timer is far from the alarms
+        max_interval_frame = tk.Frame(self.root)
+        max_interval_frame.pack(pady=5)
+        tk.Label(max_interval_frame, text="Max Idle API Interval (seconds):").pack(side=tk.LEFT)
+        max_interval_entry = ttk.Entry(max_interval_frame, textvariable=self.max_api_interval)
+        max_interval_entry.pack(side=tk.LEFT)
+        
+        # Backup Timer checkbox
+        backup_timer_frame = tk.Frame(self.root)
+        backup_timer_frame.pack(pady=5)
+        backup_timer_checkbox = ttk.Checkbutton(backup_timer_frame, text="Enable Backup Timer", variable=self.backup_timer_enabled, command=self.toggle_backup_timer)
+        backup_timer_checkbox.pack(side=tk.LEFT)
+        
+        # Alarm sound picker
+        sound_frame = tk.Frame(self.root)
+        sound_frame.pack(pady=5)
+        tk.Label(sound_frame, text="Alarm Sound:").pack(side=tk.LEFT)
+        sound_picker = ttk.Combobox(sound_frame, textvariable=self.alarm_sound_choice, values=ALARM_SOUNDS)
+        sound_picker.pack(side=tk.LEFT)
+        sound_picker.bind("<<ComboboxSelected>>", self.select_alarm_file)
+        
+        # Pre-Alarm sound picker
+        pre_alarm_frame = tk.Frame(self.root)
+        pre_alarm_frame.pack(pady=5)
+        tk.Label(pre_alarm_frame, text="Pre-Alarm Sound:").pack(side=tk.LEFT)
+        pre_alarm_picker = ttk.Combobox(pre_alarm_frame, textvariable=self.pre_alarm_sound_choice, values=PRE_ALARM_SOUNDS)
+        pre_alarm_picker.pack(side=tk.LEFT)
+        pre_alarm_picker.bind("<<ComboboxSelected>>", self.select_pre_alarm_file)
+        
+        # API Key setting button
+        api_key_frame = tk.Frame(self.root)
+        api_key_frame.pack(pady=5)
+        api_key_button = ttk.Button(api_key_frame, text="Set API Key", command=self.open_api_key_window)
+        api_key_button.pack(side=tk.LEFT)
+        
+        # Prevent Sleep checkbox
+        prevent_sleep_frame = tk.Frame(self.root)
+        prevent_sleep_frame.pack(pady=5)
+        prevent_sleep_checkbox = ttk.Checkbutton(prevent_sleep_frame, text="Prevent Sleep", variable=self.prevent_sleep)
+        prevent_sleep_checkbox.pack(side=tk.LEFT)
+        
+        # Keep on Top checkbox
+        keep_on_top_frame = tk.Frame(self.root)
+        keep_on_top_frame.pack(pady=5)
+        keep_on_top_checkbox = ttk.Checkbutton(keep_on_top_frame, text="Keep On Top", variable=self.keep_on_top, command=self.update_keep_on_top)
+        keep_on_top_checkbox.pack(side=tk.LEFT)
+        
+        # Start and Stop buttons
+        button_frame = tk.Frame(self.root)
+        button_frame.pack(pady=10)
+        start_button = ttk.Button(button_frame, text="Start", command=self.start_watching)
+        start_button.pack(side=tk.LEFT, padx=5)
+        stop_button = ttk.Button(button_frame, text="Stop", command=self.stop_watching)
+        stop_button.pack(side=tk.LEFT, padx=5)
+
+        # Add a debug checkbox to the GUI; while it is on, the profile can be written to a file
+        debug_frame = tk.Frame(self.root)
+        debug_frame.pack(pady=5)
+        debug_checkbox = ttk.Checkbutton(debug_frame, text="Debug", variable=self.debug_mode)
+        debug_checkbox.pack(side=tk.LEFT)
+        trace_button = ttk.Button(debug_frame, text="Trace Allocations", command=self.trace_allocations)
+        trace_button.pack(side=tk.LEFT, padx=5)
+        dump_profile_button = ttk.Button(debug_frame, text="Dump Profile", command=self.dump_profile)
+        dump_profile_button.pack(side=tk.LEFT, padx=5)
+        
+         # Add Faction ID checkbox and entry field
+        faction_id_frame = tk.Frame(self.root)
+        faction_id_frame.pack(pady=5)
+        faction_id_checkbox = ttk.Checkbutton(faction_id_frame, text="Faction ID", variable=self.use_faction_id, command=self.toggle_faction_id)
+        faction_id_checkbox.pack(side=tk.LEFT)
+
+        # Faction ID entry (hidden by default)
+        self.faction_id_entry = ttk.Entry(faction_id_frame, textvariable=self.faction_id)
+        self.faction_id_entry.pack(side=tk.LEFT)
+        self.faction_id_entry.pack_forget()  # Hide the entry field initially
+
+        # Extra factions watched concurrently (comma-separated IDs)
+        watch_factions_frame = tk.Frame(self.root)
+        watch_factions_frame.pack(pady=5)
+        tk.Label(watch_factions_frame, text="Watch Factions:").pack(side=tk.LEFT)
+        watch_factions_entry = ttk.Entry(watch_factions_frame, textvariable=self.watch_factions)
+        watch_factions_entry.pack(side=tk.LEFT)
+
+        # Compact table with one row per watched faction
+        self.targets_table = ttk.Treeview(self.root, columns=("faction", "chain", "time", "state"), show="headings", height=4)
+        for column, heading, width in (("faction", "Faction", 80), ("chain", "Chain", 70), ("time", "T-", 70), ("state", "State", 80)):
+            self.targets_table.heading(column, text=heading)
+            self.targets_table.column(column, width=width, anchor=tk.CENTER)
+        self.targets_table.tag_configure("alarm", background="red")
+        self.targets_table.tag_configure("pre-alarm", background="yellow")
+        self.targets_table.tag_configure("error", background="orange")
+        self.targets_table.pack(pady=5)
+
+        # Hits per faction member since Start, from the attack log
+        track_attacks_checkbox = ttk.Checkbutton(self.root, text="Track Member Hits", variable=self.track_attacks)
+        track_attacks_checkbox.pack(pady=5)
+        self.members_table = ttk.Treeview(self.root, columns=("member", "hits", "respect", "last"), show="headings", height=5)
+        for column, heading, width in (("member", "Member", 120), ("hits", "Hits", 50), ("respect", "Respect", 70), ("last", "Last Hit", 80)):
+            self.members_table.heading(column, text=heading)
+            self.members_table.column(column, width=width, anchor=tk.CENTER)
+        self.members_table.pack(pady=5)
+
+    def toggle_faction_id(self):
+        if self.use_faction_id.get():
+            self.faction_id_entry.pack(side=tk.LEFT)  # Show the entry field
+        else:
+            self.faction_id_entry.pack_forget()  # Hide the entry field
+
+    def toggle_backup_timer(self):
+        if self.backup_timer_enabled.get():
+            self.ui_updates.publish("backup", "Backup Timer: Enabled")
+        else:
+            self.ui_updates.publish("backup", "Backup Timer: Disabled")
+    
+    def collect_settings(self):
+        settings = {}
+        for key, variable in (("api_interval", self.api_interval),
+                              ("panic_interval", self.panic_interval),
+                              ("max_api_interval", self.max_api_interval),
+                              ("alarm_trigger_seconds", self.alarm_trigger_seconds),
+                              ("pre_alarm_trigger_seconds", self.pre_alarm_trigger_seconds),
+                              ("alarm_volume", self.alarm_volume),
+                              ("alarm_sound_choice", self.alarm_sound_choice),
+                              ("pre_alarm_sound_choice", self.pre_alarm_sound_choice),
+                              ("api_key", self.api_key),
+                              ("prevent_sleep", self.prevent_sleep),
+                              ("keep_on_top", self.keep_on_top),
+                              ("backup_timer_enabled", self.backup_timer_enabled),
+                              ("watch_factions", self.watch_factions),
+                              ("track_attacks", self.track_attacks),
+                              ("debug", self.debug_mode)):
+            try:
+                settings[key] = variable.get()
+            except tk.TclError:
+                # Half-typed number in an entry field, keep the previous value
+                pass
+        settings["faction_id"] = self.faction_id.get() if self.use_faction_id.get() else ""
+        return settings
+
+    def push_settings(self, *args):
+        if self.engine is not None:
+            self.engine.update_settings(self.collect_settings())
+
+    def open_api_key_window(self):
+        # New window for setting the API Key
+        api_key_window = tk.Toplevel(self.root)
+        api_key_window.title("Set API Key")
+        api_key_window.geometry("300x100")
+        
+        tk.Label(api_key_window, text="API Keys (comma-separated):").pack(pady=10)
+        api_key_entry = ttk.Entry(api_key_window, textvariable=self.api_key, width=40)
+        api_key_entry.pack(pady=5)
+        save_button = ttk.Button(api_key_window, text="Save", command=api_key_window.destroy)
+        save_button.pack(pady=5)
+        
+    def select_alarm_file(self, event):
+        if self.alarm_sound_choice.get() == "Search File":
+            file_path = filedialog.askopenfilename()
+            if file_path:
+                self.alarm_sound_choice.set(file_path)
+
+    def select_pre_alarm_file(self, event):
+        if self.pre_alarm_sound_choice.get() == "Search File":
+            file_path = filedialog.askopenfilename()
+            if file_path:
+                self.pre_alarm_sound_choice.set(file_path)
+        
+    def start_watching(self):
+        if self.engine is None:
+            # Still loading; `finish_startup` starts as soon as the engine is there
+            self.start_requested = True
+            return
+        if not self.engine.running:
+            # Decode the chosen sounds now rather than when the alarm goes off
+            if self.audio is not None:
+                self.audio.preload(self.alarm_sound_choice.get(), self.pre_alarm_sound_choice.get())
+            self.engine.update_settings(self.collect_settings())
+            self.engine.start()
+            self.refresh_targets_table()
+
+    def stop_watching(self):
+        if self.targets_refresh_job is not None:
+            self.root.after_cancel(self.targets_refresh_job)
+            self.targets_refresh_job = None
+        self.start_requested = False
+        if self.engine is not None:
+            self.engine.stop()
+        self.save_settings()
+        if self.audio is not None:
+            self.audio.stop()
+
+    def refresh_targets_table(self):
+        # Redraw one row per extra faction, colored by its own alarm state
+        rows = self.engine.multi_watcher.snapshot()
+        for row in rows:
+            minutes, seconds = divmod(row["remaining"], 60)
+            values = (row["faction_id"], row["current"], f"{minutes:02}:{seconds:02}", row["state"])
+            if self.targets_table.exists(row["faction_id"]):
+                self.targets_table.item(row["faction_id"], values=values, tags=(row["state"],))
+            else:
+                self.targets_table.insert("", tk.END, iid=row["faction_id"], values=values, tags=(row["state"],))
+        shown = {row["faction_id"] for row in rows}
+        for item in self.targets_table.get_children():
+            if item not in shown:
+                self.targets_table.delete(item)
+
+        # Member hit tally, busiest first
+        self.members_table.delete(*self.members_table.get_children())
+        for tally in self.engine.attack_log.snapshot():
+            last_hit = datetime.fromtimestamp(tally["last_hit"]).strftime("%H:%M:%S") if tally["last_hit"] else "-"
+            self.members_table.insert("", tk.END, values=(tally["name"], tally["hits"], f"{tally['respect']:.2f}", last_hit))
+
+        if self.engine.running:
+            self.targets_refresh_job = self.root.after(1000, self.refresh_targets_table)
+
+    def trace_allocations(self):
+        # Too slow to leave on with Debug: traced from here until the next dump
+        from chain_profile import get_profiler
+        if get_profiler().trace_allocations():
+            self.ui_updates.publish("banner", "Tracing allocations until the next profile dump")
+        else:
+            self.ui_updates.publish("banner", "Switch Debug on to profile, then trace allocations")
+
+    def dump_profile(self):
+        # Spans and stack samples gathered since Debug was switched on, and any allocations traced
+        from chain_profile import get_profiler
+        profiler = get_profiler()
+        if not profiler.enabled:
+            self.ui_updates.publish("banner", "Switch Debug on to profile, then dump")
+            return
+        threading.Thread(target=self._write_profile, args=(profiler,), daemon=True).start()
+
+    def _write_profile(self, profiler):
+        try:
+            path = profiler.dump()
+        except OSError as e:
+            self.ui_updates.publish("banner", f"Could not write the profile: {e}")
+            return
+        self.ui_updates.publish("banner", f"Profile written to {path}")
+
+    def update_keep_on_top(self):
+        self.root.attributes('-topmost', self.keep_on_top.get())
+
+    def flash_failure(self):
+        # Flash between yellow and red to indicate API failure; the main loop
+        # animates it, so the polling thread never waits on it
+        self.flash_count += 1
+        self.ui_updates.publish("flash", self.flash_count)
+
+
+
+
+    def handle_engine_event(self, event):
+        # Runs on the engine threads: only publish to the UI queue (sounds go through `notifications`)
+        if event["type"] == "tick":
+            remaining = event["remaining"]
+            minutes, seconds = divmod(remaining, 60)
+            self.ui_updates.publish("time", f"T-: {minutes:02}:{seconds:02}")
+
+            # Backup timer display in diagnostics box
+            if event["backup_remaining"] is not None:
+                backup_minutes, backup_seconds = divmod(event["backup_remaining"], 60)
+                self.ui_updates.publish("backup", f"Backup Timer: {backup_minutes:02}:{backup_seconds:02}")
+            else:
+                self.ui_updates.publish("backup", "Backup Timer: Disabled")
+
+            # Remaining rate-limit budget across the key pool
+            self.ui_updates.publish("budget", f"API Budget: {event['budget_remaining']}/{event['budget_per_minute']} per min"
+                                              f" | {event['hit_rate']:.1f} hits/min, break risk {event['break_risk']:.0%}")
+            upstream = self.engine.upstream
+            via = " (via publisher)" if upstream is not None and upstream.live() else ""
+            self.ui_updates.publish("clock", event["clock"] + via)
+
+            # Color changes for main timer
+            alarm_state = event["alarm_state"]
+            self.ui_updates.publish("background", ALARM_COLORS.get(alarm_state, self.default_bg))
+
+        elif event["type"] == "poll_failed":
+            self.flash_failure()  # Flash the screen for API failure
+        elif event["type"] == "circuit":
+            if event["state"] == "open":
+                self.ui_updates.publish("banner", f"Torn API keeps failing, running on the backup timer; "
+                                                  f"retrying in {event['retry_in']:.0f}s")
+            else:
+                self.ui_updates.publish("banner", "")
+
+    def save_settings(self):
+        if self.settings_save_job is not None:
+            self.root.after_cancel(self.settings_save_job)
+            self.settings_save_job = None
+        settings = self.collect_settings()
+        # The watched faction and debug toggle are per session, as before
+        del settings["faction_id"], settings["debug"]
+        # Keep settings the window has no field for (edited in the file by hand)
+        self.file_settings.update(settings)
+        save_settings(self.file_settings)
+
+    def load_settings(self):
+        settings = load_settings()
+        self.file_settings = settings
+        self.api_interval.set(settings["api_interval"])
+        self.panic_interval.set(settings["panic_interval"])
+        self.max_api_interval.set(settings["max_api_interval"])
+        self.alarm_trigger_seconds.set(settings["alarm_trigger_seconds"])
+        self.pre_alarm_trigger_seconds.set(settings["pre_alarm_trigger_seconds"])
+        self.alarm_volume.set(settings["alarm_volume"])
+        self.alarm_sound_choice.set(settings["alarm_sound_choice"])
+        self.pre_alarm_sound_choice.set(settings["pre_alarm_sound_choice"])
+        self.api_key.set(settings["api_key"])
+        self.prevent_sleep.set(settings["prevent_sleep"])
+        self.keep_on_top.set(settings["keep_on_top"])
+        self.backup_timer_enabled.set(settings["backup_timer_enabled"])
+        self.watch_factions.set(settings["watch_factions"])
+        self.track_attacks.set(settings["track_attacks"])
+        self.update_keep_on_top()
+
+
+def run_gui(args=None):
+    startup = StartupTimer(getattr(args, "started", None))
+    startup.mark("imports")
+    # Log lines go to stderr and a rotating JSON file, written off the poll and Tk threads
+    from chain_log import setup_logging, shutdown_logging
+    setup_logging(debug=getattr(args, "debug", False))
+    root = tk.Tk()
+    # `kill -USR1 <pid>` writes the profile too, and `kill -USR2` traces allocations, where there are such signals
+    from chain_profile import install_dump_signal
+    install_dump_signal()
+    app = ChainWatcherApp(root, startup, debug=getattr(args, "debug", False))
+    root.mainloop()
+    shutdown_logging()
+    return 0
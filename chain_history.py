@@ -0,0 +1,177 @@
+import csv
+import mmap
+import os
+import struct
+import sys
+import threading
+
+from chain_config import DATA_FOLDER
+
+
+HISTORY_FILE = os.path.join(DATA_FOLDER, "chain_history.bin")
+
+# File layout: a 16-byte header followed by fixed-width little-endian records
+HEADER = struct.Struct("<8sHH4x")
+MAGIC = b"CWHIST\x00\x00"
+VERSION = 1
+
+# timestamp, current, max, timeout, modifier, cooldown, latency (ms), error code, padding
+RECORD = struct.Struct("<dIIifIfh2x")
+FIELDS = ("timestamp", "current", "max", "timeout", "modifier", "cooldown", "latency", "error")
+
+# Error codes: 0 for a good poll, Torn API error codes as they come, negatives for our own
+ERROR_NONE = 0
+ERROR_TRANSPORT = -1
+ERROR_HTTP = -2
+ERROR_TORN_UNKNOWN = -3  # Torn's own code 0 ("unknown error"), which would read as a good poll
+
+
+def record_dtype():
+    """NumPy dtype matching `RECORD`, for memory-mapped reads."""
+    import numpy as np
+    return np.dtype([("timestamp", "<f8"), ("current", "<u4"), ("max", "<u4"), ("timeout", "<i4"),
+                     ("modifier", "<f4"), ("cooldown", "<u4"), ("latency", "<f4"), ("error", "<i2"),
+                     ("_pad", "<i2")])
+
+
+class ChainHistory:
+    """Append-only time series of every poll, one fixed-width record each.
+
+    Appending is a single `struct.pack` and buffered write, so recording costs
+    next to nothing per poll. Reads memory-map the file: with NumPy installed
+    they return a structured array view without copying, otherwise a list of
+    tuples; either way a time range is found by binary search on the timestamps.
+    """
+
+    def __init__(self, path=HISTORY_FILE):
+        self.path = path
+        self._file = None
+        self._lock = threading.Lock()
+
+    def _open_for_append(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        f = open(self.path, "ab")
+        size = f.seek(0, os.SEEK_END)
+        if size < HEADER.size:
+            f.truncate(0)
+            f.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+        else:
+            # Drop a record half-written by a crash so every record stays aligned
+            partial = (size - HEADER.size) % RECORD.size
+            if partial:
+                f.truncate(size - partial)
+        return f
+
+    def append(self, timestamp, current=0, maximum=0, timeout=0, modifier=0.0, cooldown=0,
+               latency=0.0, error=ERROR_NONE):
+        record = RECORD.pack(timestamp, current, maximum, timeout, modifier, cooldown, latency, error)
+        with self._lock:
+            if self._file is None:
+                self._file = self._open_for_append()
+            self._file.write(record)
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __len__(self):
+        if not os.path.exists(self.path):
+            return 0
+        return max(0, (os.path.getsize(self.path) - HEADER.size) // RECORD.size)
+
+    def _check_header(self, f):
+        magic, version, record_size = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+            raise ValueError(f"{self.path} is not a version {VERSION} chain history file")
+
+    def read(self, start=None, end=None):
+        """Records with `start <= timestamp < end` (server epoch seconds).
+
+        Returns a NumPy structured array backed by the file when NumPy is available,
+        otherwise a list of tuples in `FIELDS` order.
+        """
+        count = len(self)
+        if count == 0:
+            return []
+        with open(self.path, "rb") as f:
+            self._check_header(f)
+        try:
+            import numpy as np
+        except ImportError:
+            return self._read_without_numpy(count, start, end)
+
+        records = np.memmap(self.path, dtype=record_dtype(), mode="r", offset=HEADER.size, shape=(count,))
+        timestamps = records["timestamp"]
+        first = 0 if start is None else int(np.searchsorted(timestamps, start, side="left"))
+        last = count if end is None else int(np.searchsorted(timestamps, end, side="left"))
+        return records[first:last]
+
+    def _read_without_numpy(self, count, start, end):
+        with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            def timestamp(index):
+                return struct.unpack_from("<d", data, HEADER.size + index * RECORD.size)[0]
+
+            def bisect(value):
+                low, high = 0, count
+                while low < high:
+                    middle = (low + high) // 2
+                    if timestamp(middle) < value:
+                        low = middle + 1
+                    else:
+                        high = middle
+                return low
+
+            first = 0 if start is None else bisect(start)
+            last = count if end is None else bisect(end)
+            return [RECORD.unpack_from(data, HEADER.size + index * RECORD.size)
+                    for index in range(first, last)]
+
+    def export_csv(self, path, start=None, end=None):
+        rows = self.read(start, end)
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(FIELDS)
+            for row in rows:
+                writer.writerow([row[field] for field in FIELDS] if not isinstance(row, tuple) else row)
+        return len(rows)
+
+    def export_parquet(self, path, start=None, end=None):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet export needs pyarrow: pip install pyarrow")
+        rows = self.read(start, end)
+        if isinstance(rows, list):
+            columns = {field: [row[index] for row in rows] for index, field in enumerate(FIELDS)}
+        else:
+            columns = {field: rows[field] for field in FIELDS}
+        pq.write_table(pa.table(columns), path)
+        return len(rows)
+
+
+def add_history_arguments(parser):
+    parser.add_argument("--file", default=HISTORY_FILE, help="History file (default: %(default)s)")
+    parser.add_argument("--since", type=float, help="Only records at or after this epoch time")
+    parser.add_argument("--until", type=float, help="Only records before this epoch time")
+    parser.add_argument("--format", choices=("csv", "parquet"), default="csv")
+    parser.add_argument("output", help="File to export to")
+
+
+def run_history_export(args):
+    history = ChainHistory(args.file)
+    try:
+        if args.format == "parquet":
+            count = history.export_parquet(args.output, args.since, args.until)
+        else:
+            count = history.export_csv(args.output, args.since, args.until)
+    except (RuntimeError, ValueError, OSError) as e:
+        print(f"History export failed: {e}", file=sys.stderr)
+        return 1
+    print(f"Exported {count} records to {args.output}")
+    return 0
@@ -0,0 +1,167 @@
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import sys
+import threading
+from datetime import datetime
+
+from chain_config import DATA_FOLDER
+
+
+LOG_FILE = os.path.join(DATA_FOLDER, "chainwatch.log")
+LOG_MAX_BYTES = 1024 * 1024  # Rotated at 1 MiB...
+LOG_BACKUPS = 3  # ...keeping this many old files
+
+# Records waiting for the writer thread; past `QUEUE_PRESSURE` of it only warnings and errors get in
+QUEUE_SIZE = 1000
+QUEUE_PRESSURE = 0.75
+
+REDACTED = "[redacted]"
+
+# `key=` query parameters, as they show up in request URLs and requests' error messages
+_KEY_PARAMETER = re.compile(r"(\bkey=)[^&\s\"']+")
+
+# Attributes every LogRecord has; anything else came in through `extra=` and goes into the JSON
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_secrets = set()
+_secrets_pattern = None
+_secrets_lock = threading.Lock()
+
+
+def register_secrets(*secrets):
+    """Have these strings (the API keys) blanked out of every log record."""
+    global _secrets_pattern
+    with _secrets_lock:
+        new = {secret for secret in secrets if secret and len(secret) >= 8} - _secrets
+        if not new:
+            return
+        _secrets.update(new)
+        _secrets_pattern = re.compile("|".join(re.escape(secret) for secret in sorted(_secrets, key=len, reverse=True)))
+
+
+def redact(text):
+    """`text` with API keys and `key=` parameters replaced by `REDACTED`."""
+    text = _KEY_PARAMETER.sub(r"\1" + REDACTED, text)
+    pattern = _secrets_pattern
+    if pattern is not None:
+        text = pattern.sub(REDACTED, text)
+    return text
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message and any `extra` fields."""
+
+    def format(self, record):
+        entry = {"time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+                 "level": record.levelname, "logger": record.name, "thread": record.threadName,
+                 "message": record.getMessage()}
+        for name, value in vars(record).items():
+            if name not in _RECORD_FIELDS:
+                entry[name] = value
+        return json.dumps(entry, default=str)
+
+
+class ConsoleFormatter(logging.Formatter):
+    # The "[time] message" lines the watcher has always printed to stderr
+    def __init__(self):
+        super().__init__("[%(asctime)s] %(message)s", "%Y-%m-%d %H:%M:%S")
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the writer thread without ever waiting.
+
+    Once the queue is `QUEUE_PRESSURE` full, debug and info records are dropped
+    so that warnings and errors still fit; when it is full, everything is. The
+    drops are counted and reported by the next record that gets through. The
+    message (with any traceback) and `extra` strings are redacted before queueing.
+    """
+
+    def __init__(self, log_queue, pressure=QUEUE_PRESSURE):
+        super().__init__(log_queue)
+        self.limit = int(log_queue.maxsize * pressure)
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def enqueue(self, record):
+        if record.levelno < logging.WARNING and self.queue.qsize() >= self.limit:
+            self._drop()
+            return
+        with self._lock:
+            dropped, self.dropped = self.dropped, 0
+        if dropped:
+            record.dropped_before = dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self._drop(dropped + 1)
+
+    def _drop(self, count=1):
+        with self._lock:
+            self.dropped += count
+
+    def prepare(self, record):
+        record = super().prepare(record)
+        record.msg = record.message = redact(record.message)
+        for name, value in list(vars(record).items()):
+            if name not in _RECORD_FIELDS and isinstance(value, str):
+                setattr(record, name, redact(value))
+        return record
+
+
+_listener = None
+_setup_lock = threading.Lock()
+
+
+def setup_logging(debug=False, path=LOG_FILE, console=True):
+    """Route the `chainwatch` loggers through a queue to a rotating JSON file and stderr.
+
+    Callers on the poll and timer threads only put records on a bounded queue;
+    one writer thread does the formatting and I/O, so a slow terminal or disk
+    never holds up a poll. Safe to call again, which only changes the level.
+    """
+    global _listener
+    with _setup_lock:
+        logger = logging.getLogger("chainwatch")
+        set_debug(debug)
+        if _listener is not None:
+            return _listener
+
+        handlers = []
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            file_handler = logging.handlers.RotatingFileHandler(path, maxBytes=LOG_MAX_BYTES,
+                                                                backupCount=LOG_BACKUPS, encoding="utf-8")
+            file_handler.setFormatter(JsonFormatter())
+            handlers.append(file_handler)
+        except OSError as e:
+            print(f"Logging to {path} unavailable: {e}", file=sys.stderr)
+        if console:
+            console_handler = logging.StreamHandler(sys.stderr)
+            console_handler.setFormatter(ConsoleFormatter())
+            handlers.append(console_handler)
+
+        log_queue = queue.Queue(QUEUE_SIZE)
+        queue_handler = DroppingQueueHandler(log_queue)
+        logger.addHandler(queue_handler)
+        logger.propagate = False
+        _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        return _listener
+
+
+def set_debug(enabled):
+    """Let debug records through (the Debug toggle) or only info and up."""
+    logging.getLogger("chainwatch").setLevel(logging.DEBUG if enabled else logging.INFO)
+
+
+def shutdown_logging():
+    """Write out what is still queued and stop the writer thread."""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
@@ -0,0 +1,343 @@
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Latency buckets (seconds) for the API request histogram
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value):
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple((name, labels.get(name, "")) for name in self.label_names)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in sorted(self._values.items())]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, optionally split by labels."""
+
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Value that goes up and down; unset label sets are left out of the output."""
+
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def clear(self, **labels):
+        with self._lock:
+            self._values.pop(self._key(labels), None)
+
+
+class Histogram(_Metric):
+    """Cumulative bucket counts plus sum and count, as Prometheus expects."""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._counts = [0] * len(self.buckets)
+        self._sum = 0.0
+        self._count = 0
+
+    def observe(self, value):
+        with self._lock:
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self._counts[index] += 1
+                    break
+            self._sum += value
+            self._count += 1
+
+    def samples(self):
+        with self._lock:
+            samples = []
+            cumulative = 0
+            for bound, count in zip(self.buckets, self._counts):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", (("le", _format_value(bound)),), cumulative))
+            samples.append((f"{self.name}_sum", (), self._sum))
+            samples.append((f"{self.name}_count", (), self._count))
+            return samples
+
+
+class MetricsRegistry:
+    """A set of metrics rendered together in the Prometheus text format."""
+
+    def __init__(self):
+        self.metrics = []
+        self._collectors = []
+
+    def counter(self, name, documentation, labels=()):
+        return self._add(Counter(name, documentation, labels))
+
+    def gauge(self, name, documentation, labels=()):
+        return self._add(Gauge(name, documentation, labels))
+
+    def histogram(self, name, documentation, buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, documentation, buckets))
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def on_collect(self, callback):
+        """Call `callback()` before every scrape, to refresh time-based values."""
+        self._collectors.append(callback)
+
+    def render(self):
+        for callback in self._collectors:
+            callback()
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer(ThreadingHTTPServer):
+    """Serve a registry on `/metrics` from a background thread."""
+
+    daemon_threads = True
+
+    def __init__(self, registry, port, host="127.0.0.1"):
+        super().__init__((host, port), _MetricsHandler)
+        self.registry = registry
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+
+class EngineMetrics:
+    """Engine listener keeping the watcher's metrics up to date from its events."""
+
+    def __init__(self, registry=None):
+        self.registry = registry if registry is not None else MetricsRegistry()
+        registry = self.registry
+        self.request_duration = registry.histogram(
+            "chainwatch_api_request_duration_seconds", "Latency of Torn API chain requests.")
+        self.polls = registry.counter(
+            "chainwatch_polls_total", "Chain polls by result.", labels=("result",))
+        self.poll_errors = registry.counter(
+            "chainwatch_poll_errors_total",
+            "Failed polls by Torn error code, or http_<status> / transport.", labels=("code",))
+        self.since_success = registry.gauge(
+            "chainwatch_seconds_since_last_success",
+            "Seconds since the last successful poll, or since the watcher started if none has succeeded yet.")
+        self.clock_offset = registry.gauge(
+            "chainwatch_clock_offset_seconds", "Estimated Torn server time minus local wall time.")
+        self.clock_uncertainty = registry.gauge(
+            "chainwatch_clock_uncertainty_seconds", "Half-width of the server clock estimate.")
+        self.countdown = registry.gauge(
+            "chainwatch_countdown_seconds", "Seconds left on the chain timer.")
+        self.backup_countdown = registry.gauge(
+            "chainwatch_backup_countdown_seconds", "Seconds left on the backup timer.")
+        self.chain_hits = registry.gauge(
+            "chainwatch_chain_hits", "Current length of the chain.")
+        self.poll_interval = registry.gauge(
+            "chainwatch_poll_interval_seconds", "Delay before the next poll.")
+        self.budget = registry.gauge(
+            "chainwatch_api_budget_remaining", "Requests left across the API key pool.")
+        self.hit_rate = registry.gauge(
+            "chainwatch_hit_rate_per_minute", "Estimated hits per minute on the chain.")
+        self.break_risk = registry.gauge(
+            "chainwatch_break_risk", "Estimated chance that no hit lands before the chain timer runs out.")
+        self.panic_mode = registry.gauge(
+            "chainwatch_panic_mode", "1 while polling at the panic interval.")
+        self.panic_seconds = registry.counter(
+            "chainwatch_panic_mode_seconds_total", "Time spent in panic mode.")
+        self.alarms = registry.counter(
+            "chainwatch_alarm_activations_total", "Alarm and pre-alarm activations.",
+            labels=("faction", "state"))
+        self.hedges = registry.counter(
+            "chainwatch_hedged_requests_total",
+            "Polls raced by a second request, by which copy answered first.", labels=("winner",))
+        self.hedge_saved = registry.counter(
+            "chainwatch_hedge_saved_seconds_total", "Time the winning hedged requests saved.")
+        self.hedge_stats = None  # The client's HedgeStats, read on every scrape
+        self._hedge_saved_seen = 0.0
+        self.member_hits = registry.counter(
+            "chainwatch_member_hits_total", "Chain hits by faction member ID, from the attack log.",
+            labels=("member_id",))
+        self.member_info = registry.gauge(
+            "chainwatch_member_info", "Always 1; the current name of each faction member with hits.",
+            labels=("member_id", "name"))
+        self._member_names = {}  # Member ID -> name in `member_info`, so a rename replaces the series
+        self.circuit_open = registry.gauge(
+            "chainwatch_circuit_open", "1 while polling is paused after repeated API failures.")
+        self.running = registry.gauge(
+            "chainwatch_running", "1 while the watcher is running.")
+        self.running.set(0)
+
+        self._last_success = None
+        self._panic_since = None
+        self._lock = threading.Lock()
+        registry.on_collect(self._collect)
+
+    def _collect(self):
+        now = time.monotonic()
+        with self._lock:
+            if self.hedge_stats is not None:
+                # Savings are only known once the losing request finishes, after its poll event
+                saved = self.hedge_stats.saved
+                self.hedge_saved.inc(saved - self._hedge_saved_seen)
+                self._hedge_saved_seen = saved
+            if self._last_success is not None:
+                self.since_success.set(now - self._last_success)
+            if self._panic_since is not None:
+                # Count the open panic stretch up to now, so the counter moves while it lasts
+                self.panic_seconds.inc(now - self._panic_since)
+                self._panic_since = now
+
+    def _set_panic(self, panic):
+        now = time.monotonic()
+        with self._lock:
+            if panic and self._panic_since is None:
+                self._panic_since = now
+            elif not panic and self._panic_since is not None:
+                self.panic_seconds.inc(now - self._panic_since)
+                self._panic_since = None
+        self.panic_mode.set(1 if panic else 0)
+
+    def __call__(self, event):
+        event_type = event["type"]
+        if event_type in ("poll", "poll_unchanged"):
+            with self._lock:
+                self._last_success = time.monotonic()
+            self.polls.inc(result="ok")
+            self.request_duration.observe(event["timing"]["total"])
+            self.poll_interval.set(event["interval"])
+            if event["timing"].get("hedged"):
+                self.hedges.inc(winner="hedge" if event["timing"]["hedge_won"] else "first")
+            if event_type == "poll":
+                self.chain_hits.set(event["chain"].get("current", 0))
+                self._set_panic(event["panic_mode"])
+        elif event_type == "upstream_update":
+            # Pushed by a fan-out publisher: the chain moved, but no poll of ours went out
+            self.chain_hits.set(event["chain"].get("current", 0))
+            self._set_panic(event["panic_mode"])
+        elif event_type == "poll_failed":
+            self.polls.inc(result="error")
+            if event.get("code") is not None:
+                code = str(event["code"])
+            elif event.get("status") is not None:
+                code = f"http_{event['status']}"
+            else:
+                code = "transport"
+            self.poll_errors.inc(code=code)
+            if event.get("latency") is not None:
+                self.request_duration.observe(event["latency"])
+            self.poll_interval.set(event["interval"])
+        elif event_type == "tick":
+            self.countdown.set(event["remaining"])
+            if event["backup_remaining"] is not None:
+                self.backup_countdown.set(event["backup_remaining"])
+            else:
+                self.backup_countdown.clear()
+            self.budget.set(event["budget_remaining"])
+            self.hit_rate.set(event["hit_rate"])
+            self.break_risk.set(event["break_risk"])
+            self.clock_offset.set(event["clock_offset"])
+            if event["clock_uncertainty"] is not None:
+                self.clock_uncertainty.set(event["clock_uncertainty"])
+        elif event_type == "alarm":
+            if event["state"] != "off":
+                self.alarms.inc(faction="main", state=event["state"])
+        elif event_type == "target_alarm":
+            if event["state"] in ("alarm", "pre-alarm"):
+                self.alarms.inc(faction=event["faction_id"], state=event["state"])
+        elif event_type == "hits":
+            for hit in event["hits"]:
+                member_id = str(hit["member_id"])
+                self.member_hits.inc(member_id=member_id)
+                name = hit["name"] or member_id
+                previous = self._member_names.get(member_id)
+                if name != previous:
+                    if previous is not None:
+                        self.member_info.clear(member_id=member_id, name=previous)
+                    self.member_info.set(1, member_id=member_id, name=name)
+                    self._member_names[member_id] = name
+        elif event_type == "circuit":
+            self.circuit_open.set(1 if event["state"] == "open" else 0)
+        elif event_type == "started":
+            with self._lock:
+                # A watcher that never gets a poll through must still show the gap growing
+                self._last_success = time.monotonic()
+            self.running.set(1)
+        elif event_type == "stopped":
+            self.running.set(0)
+            self._set_panic(False)
+
+
+def start_metrics(engine, port, host="127.0.0.1"):
+    """Subscribe metrics to `engine` and serve them on `port`; returns the server."""
+    metrics = EngineMetrics()
+    metrics.hedge_stats = getattr(engine.api_client, "hedge_stats", None)
+    engine.subscribe(metrics)
+    if engine.running:
+        metrics({"type": "started", "time": engine.server_clock.now()})
+    return MetricsServer(metrics.registry, port, host)
@@ -0,0 +1,201 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from chain_clock import ServerClock
+from chain_retry import Backoff
+from chain_scheduler import PollScheduler
+from torn_api import KEY_QUARANTINE_SECONDS, RATE_LIMIT_QUARANTINE_SECONDS, classify_error
+
+
+log = logging.getLogger("chainwatch.multi")
+
+
+class WatchTarget:
+    """Chain state, countdown and alarm state of one watched faction."""
+
+    def __init__(self, faction_id):
+        self.faction_id = faction_id
+        self.chain_end_time = 0
+        self.current = 0
+        self.timeout = 0
+        self.last_update = None
+        self.failed = False
+        self.error = None
+        self.alarm_state = "idle"
+        self.scheduler = PollScheduler()
+        self.backoff = Backoff()
+
+    def remaining_seconds(self, now):
+        return max(0, int(self.chain_end_time - now))
+
+    def update_alarm_state(self, alarm_seconds, pre_alarm_seconds, now):
+        remaining = self.remaining_seconds(now)
+        if self.last_update is None or remaining <= 0:
+            self.alarm_state = "idle"
+        elif remaining <= alarm_seconds:
+            self.alarm_state = "alarm"
+        elif remaining <= pre_alarm_seconds:
+            self.alarm_state = "pre-alarm"
+        else:
+            self.alarm_state = "ok"
+        return self.alarm_state
+
+
+class MultiChainWatcher:
+    """Poll any number of faction chains from a single asyncio event loop.
+
+    Every target runs as its own task with its own adaptive interval, while the blocking
+    HTTP calls share one pooled `TornApiClient` through a small executor, so N
+    factions cost one thread for the loop plus a bounded worker pool instead of
+    N independent watchers.
+    """
+
+    def __init__(self, client, clock=None, max_workers=4):
+        self.client = client
+        self.clock = clock if clock is not None else ServerClock()
+        self.api_interval = 5
+        self.panic_interval = 2
+        self.max_interval = 30
+        self.alarm_trigger_seconds = 60
+        self.pre_alarm_trigger_seconds = 90
+        self.targets = {}
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._executor = None
+        self._tasks = {}
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, faction_ids):
+        if self.running:
+            self.set_targets(faction_ids)
+            return
+        self._loop = asyncio.new_event_loop()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="chain-poll")
+        self._thread = threading.Thread(target=self._run_loop, daemon=True)
+        self._thread.start()
+        self.set_targets(faction_ids)
+
+    def stop(self):
+        if not self.running:
+            return
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop)
+        self._thread.join(timeout=5)
+        self._executor.shutdown(wait=False)
+        self._thread = None
+
+    def set_targets(self, faction_ids):
+        """Replace the watched factions; safe to call from any thread."""
+        if self.running:
+            self._loop.call_soon_threadsafe(self._apply_targets, list(faction_ids))
+
+    def snapshot(self):
+        """Return a copy of every target's state for display."""
+        now = self.clock.now()
+        with self._lock:
+            targets = list(self.targets.values())
+        rows = []
+        for target in targets:
+            state = target.update_alarm_state(self.alarm_trigger_seconds, self.pre_alarm_trigger_seconds, now)
+            rows.append({
+                "faction_id": target.faction_id,
+                "current": target.current,
+                "remaining": target.remaining_seconds(now),
+                "state": "error" if target.failed else state,
+                "error": target.error,
+            })
+        return rows
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_forever()
+        finally:
+            self._loop.close()
+
+    def _apply_targets(self, faction_ids):
+        with self._lock:
+            for faction_id in list(self.targets):
+                if faction_id not in faction_ids:
+                    del self.targets[faction_id]
+                    self._tasks.pop(faction_id).cancel()
+            for faction_id in faction_ids:
+                if faction_id not in self.targets:
+                    target = WatchTarget(faction_id)
+                    self.targets[faction_id] = target
+                    self._tasks[faction_id] = self._loop.create_task(self._watch(target))
+
+    async def _shutdown(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+        with self._lock:
+            self.targets.clear()
+        self._loop.stop()
+
+    async def _watch(self, target):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                data, timing = await loop.run_in_executor(
+                    self._executor, self.client.get_chain, target.faction_id)
+                chain = data["chain"]
+                target.chain_end_time = chain["end"]
+                target.current = chain.get("current", 0)
+                target.timeout = chain.get("timeout", 0)
+                target.last_update = time.time()
+                if timing.server_time is not None:
+                    self.clock.add_sample(timing.server_time, timing.sent, timing.received)
+                target.failed = False
+                target.error = None
+                target.backoff.reset()
+                target.scheduler.observe(target.current, timeout=target.timeout)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                target.failed = True
+                target.error = str(e)
+                error_class = classify_error(e)
+                log.warning(f"API request for faction {target.faction_id} failed: {e}",
+                            extra={"faction_id": target.faction_id, "error_class": error_class})
+                api_key = getattr(e, "api_key", None)
+                if error_class == "key" and api_key:
+                    self.client.key_pool.quarantine(api_key, KEY_QUARANTINE_SECONDS)
+                elif error_class == "rate_limit" and api_key:
+                    self.client.key_pool.quarantine(api_key, RATE_LIMIT_QUARANTINE_SECONDS)
+
+            # Each target schedules its next poll from its own remaining timeout
+            if target.failed:
+                # Failing polls back off (jittered) so an outage isn't met with more requests
+                target.backoff.base = self.panic_interval
+                target.backoff.cap = self.max_interval
+                interval = target.backoff.next_delay()
+            else:
+                scheduler = target.scheduler
+                scheduler.api_interval = self.api_interval
+                scheduler.panic_interval = self.panic_interval
+                scheduler.max_interval = self.max_interval
+                scheduler.alarm_trigger_seconds = self.alarm_trigger_seconds
+                scheduler.pre_alarm_trigger_seconds = self.pre_alarm_trigger_seconds
+                key_pool = self.client.key_pool
+                interval = scheduler.next_interval(target.timeout, key_pool.remaining_budget(),
+                                                   key_pool.budget_per_minute())
+            await asyncio.sleep(interval)
+
+
+def parse_faction_ids(text):
+    """Split a comma or space separated list of faction IDs, ignoring junk."""
+    faction_ids = []
+    for part in text.replace(",", " ").split():
+        if part.isdigit() and part not in faction_ids:
+            faction_ids.append(part)
+    return faction_ids
@@ -0,0 +1,315 @@
+import collections
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import threading
+
+from chain_profile import span
+from torn_api import TokenBucket
+
+
+# Pending notifications kept per sink before the oldest are dropped
+QUEUE_SIZE = 32
+
+# Alarm states worth telling people about outside the window
+ALERT_STATES = ("pre-alarm", "alarm")
+
+log = logging.getLogger("chainwatch.notify")
+
+
+def notification_for(event):
+    """Turn an engine event into a notification dict, or None if it is not one.
+
+    `key` names what the notification is about: a newer notification with the
+    same key replaces one still waiting to be delivered.
+    """
+    event_type = event["type"]
+    if event_type == "alarm":
+        state = event["state"]
+        remaining = event["remaining"]
+        if state == "off":
+            message = "Chain timer is safe again"
+        else:
+            message = f"Chain {state}: {remaining // 60}:{remaining % 60:02d} left"
+        return {"kind": "alarm", "key": "alarm", "state": state, "remaining": remaining,
+                "title": "Chain Watcher", "message": message, "time": event["time"]}
+    if event_type == "target_alarm":
+        remaining = event["remaining"]
+        return {"kind": "target_alarm", "key": f"target_alarm:{event['faction_id']}", "state": event["state"],
+                "remaining": remaining, "faction_id": event["faction_id"], "title": "Chain Watcher",
+                "message": f"Faction {event['faction_id']} chain {event['state']}: "
+                           f"{remaining // 60}:{remaining % 60:02d} left",
+                "time": event["time"]}
+    if event_type == "circuit" and event["state"] == "open":
+        return {"kind": "circuit", "key": "circuit", "state": "open", "title": "Chain Watcher",
+                "message": f"Torn API keeps failing ({event['error']}); running on the backup timer",
+                "time": event["time"]}
+    if event_type == "stopped":
+        return {"kind": "alarm", "key": "alarm", "state": "off", "remaining": 0,
+                "title": "Chain Watcher", "message": "Watcher stopped", "time": event["time"]}
+    return None
+
+
+class SinkWorker:
+    """One sink's bounded queue and delivery thread.
+
+    `offer` never blocks: a notification with the key of one still waiting takes
+    its place (so a flapping alarm is sent once, in its latest state), and once
+    `QUEUE_SIZE` are waiting the oldest is dropped. Delivery runs on the worker's
+    own thread and is spaced out to the sink's `rate_per_minute`, so however slow
+    or failing a sink is, the engine's threads never wait on it.
+    """
+
+    def __init__(self, sink, queue_size=QUEUE_SIZE):
+        self.sink = sink
+        self.queue_size = queue_size
+        self.delivered = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.failed = 0
+        rate = getattr(sink, "rate_per_minute", None)
+        self.bucket = TokenBucket(max(1, rate // 2), rate / 60) if rate else None
+        self._pending = collections.OrderedDict()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True, name=f"notify-{sink.name}")
+        self._thread.start()
+
+    def offer(self, notification):
+        with self._condition:
+            key = notification["key"]
+            if not self.sink.accepts(notification):
+                # Not for this sink, but it still outdates what is waiting under its key
+                if self._pending.pop(key, None) is not None:
+                    self.coalesced += 1
+                return
+            if key in self._pending:
+                del self._pending[key]
+                self.coalesced += 1
+            elif len(self._pending) >= self.queue_size:
+                self._pending.popitem(last=False)
+                self.dropped += 1
+            self._pending[key] = notification
+            self._condition.notify()
+
+    def _next(self):
+        with self._condition:
+            while not self._pending and not self._closed:
+                self._condition.wait()
+            if self._closed:
+                return None
+            if self.bucket is not None and not self.bucket.try_take():
+                # Over the sink's rate: let more notifications coalesce meanwhile
+                self._condition.wait(self.bucket.time_until_available())
+                return False
+            return self._pending.popitem(last=False)[1]
+
+    def _run(self):
+        while True:
+            notification = self._next()
+            if notification is None:
+                return
+            if notification is False:
+                continue
+            try:
+                self.sink.deliver(notification)
+                self.delivered += 1
+            except Exception as e:
+                self.failed += 1
+                log.warning(f"Notification sink {self.sink.name} failed: {e}", extra={"sink": self.sink.name})
+
+    def stats(self):
+        with self._condition:
+            return {"sink": self.sink.name, "delivered": self.delivered, "coalesced": self.coalesced,
+                    "dropped": self.dropped, "failed": self.failed, "pending": len(self._pending)}
+
+    def close(self, timeout=1.0):
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join(timeout)
+        close = getattr(self.sink, "close", None)
+        if close is not None:
+            close()
+
+
+class NotificationBus:
+    """Engine listener fanning alarm notifications out to sinks, each on its own worker.
+
+    Sinks are objects with a `name`, a `deliver(notification)` method, an
+    `accepts(notification)` filter and optionally a `rate_per_minute` limit.
+    """
+
+    def __init__(self, sinks=()):
+        self.workers = [SinkWorker(sink) for sink in sinks]
+
+    def add_sink(self, sink):
+        self.workers.append(SinkWorker(sink))
+
+    def __call__(self, event):
+        notification = notification_for(event)
+        if notification is None:
+            return
+        for worker in self.workers:
+            worker.offer(notification)
+
+    def stats(self):
+        return [worker.stats() for worker in self.workers]
+
+    def refresh(self):
+        """Re-apply the latest state on sinks that hold one (the sound, once audio loads or a file changes)."""
+        for worker in self.workers:
+            refresh = getattr(worker.sink, "refresh", None)
+            if refresh is not None:
+                refresh()
+
+    def close(self):
+        for worker in self.workers:
+            worker.close()
+
+
+class SoundSink:
+    """Plays the alarm and pre-alarm sounds with `AlarmAudio`."""
+
+    name = "sound"
+    rate_per_minute = None  # State changes must never wait
+
+    def __init__(self, audio, settings):
+        self.audio = audio  # An `AlarmAudio`, or a callable returning one (None until it has loaded)
+        self.settings = settings
+        self.state = "off"  # Latest alarm state, kept even while there is no audio to play it
+        self._lock = threading.Lock()
+
+    def accepts(self, notification):
+        return notification["kind"] == "alarm"
+
+    def deliver(self, notification):
+        with self._lock:
+            self.state = notification["state"]
+            self._apply()
+
+    def refresh(self):
+        """Play the latest state with the current files: audio that loaded late, or a sound changed mid-alarm."""
+        with self._lock:
+            self._apply()
+
+    def _apply(self):
+        audio = self.audio() if callable(self.audio) else self.audio
+        if audio is not None:
+            settings = self.settings
+            with span("audio"):
+                audio.set_state(self.state, settings["alarm_sound_choice"], settings["pre_alarm_sound_choice"])
+
+    def close(self):
+        audio = self.audio() if callable(self.audio) else self.audio
+        if audio is not None:
+            audio.stop()
+
+
+class _AlertSink:
+    # Sinks that tell people: alarms going off and outages, not the all-clear
+    def __init__(self, rate_per_minute=6):
+        self.rate_per_minute = rate_per_minute
+
+    def accepts(self, notification):
+        return notification["state"] in ALERT_STATES or notification["kind"] == "circuit"
+
+
+class DesktopSink(_AlertSink):
+    """Desktop notifications: plyer when installed, else notify-send or osascript."""
+
+    name = "desktop"
+
+    def __init__(self, rate_per_minute=6):
+        super().__init__(rate_per_minute)
+        try:
+            from plyer import notification as plyer_notification
+        except ImportError:
+            plyer_notification = None
+        self._plyer = plyer_notification
+
+    def deliver(self, notification):
+        title, message = notification["title"], notification["message"]
+        if self._plyer is not None:
+            self._plyer.notify(title=title, message=message, app_name="Chain Watcher", timeout=10)
+        elif sys.platform == "darwin":
+            script = f"display notification {json.dumps(message)} with title {json.dumps(title)}"
+            subprocess.run(["osascript", "-e", script], timeout=10, check=True)
+        elif shutil.which("notify-send"):
+            urgency = "critical" if notification["state"] == "alarm" else "normal"
+            subprocess.run(["notify-send", "-u", urgency, title, message], timeout=10, check=True)
+        else:
+            raise RuntimeError("No desktop notifier found (install plyer)")
+
+
+class WebhookSink(_AlertSink):
+    """POST notifications as JSON to a webhook, e.g. a Discord or Slack channel.
+
+    The body carries the text as `content` (Discord) and `text` (Slack), plus the
+    whole notification under `notification` for anything else.
+    """
+
+    name = "webhook"
+
+    def __init__(self, url, rate_per_minute=6, timeout=5.0):
+        super().__init__(rate_per_minute)
+        import requests
+
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def deliver(self, notification):
+        text = f"{notification['title']}: {notification['message']}"
+        body = {"content": text, "text": text, "notification": notification}
+        response = self.session.post(self.url, json=body, timeout=self.timeout)
+        response.raise_for_status()
+
+    def close(self):
+        self.session.close()
+
+
+class ScriptSink(_AlertSink):
+    """Run a local command for every notification.
+
+    The notification is passed as JSON on stdin and in the `CHAINWATCH_*`
+    environment variables; the command is killed after `timeout` seconds.
+    """
+
+    name = "script"
+
+    def __init__(self, command, rate_per_minute=6, timeout=10.0):
+        super().__init__(rate_per_minute)
+        self.command = command
+        self.timeout = timeout
+
+    def deliver(self, notification):
+        environment = dict(os.environ,
+                           CHAINWATCH_KIND=notification["kind"],
+                           CHAINWATCH_STATE=str(notification.get("state", "")),
+                           CHAINWATCH_REMAINING=str(notification.get("remaining", "")),
+                           CHAINWATCH_MESSAGE=notification["message"])
+        subprocess.run(self.command, shell=True, input=json.dumps(notification).encode(), env=environment,
+                       timeout=self.timeout, check=True, stdout=subprocess.DEVNULL)
+
+
+def start_notifications(engine, settings, audio=None):
+    """Subscribe a bus with the sinks the settings ask for; returns it for closing.
+
+    `audio` (an `AlarmAudio` or a callable returning one) adds the sound sink.
+    """
+    bus = NotificationBus()
+    rate = settings["notify_rate_per_minute"]
+    if audio is not None:
+        bus.add_sink(SoundSink(audio, engine.settings))
+    if settings["notify_desktop"]:
+        bus.add_sink(DesktopSink(rate))
+    if settings["notify_webhook"]:
+        bus.add_sink(WebhookSink(settings["notify_webhook"], rate))
+    if settings["notify_script"]:
+        bus.add_sink(ScriptSink(settings["notify_script"], rate))
+    engine.subscribe(bus)
+    return bus
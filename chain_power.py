@@ -0,0 +1,148 @@
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import threading
+
+
+# SetThreadExecutionState flags
+ES_CONTINUOUS = 0x80000000
+ES_SYSTEM_REQUIRED = 0x00000001
+ES_DISPLAY_REQUIRED = 0x00000002
+
+INHIBIT_REASON = "Watching a Torn chain"
+
+log = logging.getLogger("chainwatch.power")
+
+
+class _WindowsBackend:
+    # The execution state belongs to the thread that set it, so a dedicated thread
+    # sets it once and holds it until released, whichever thread asks
+    name = "SetThreadExecutionState"
+
+    def __init__(self):
+        self._release = None
+
+    def acquire(self):
+        self._release = threading.Event()
+        started = threading.Event()
+        threading.Thread(target=self._hold, args=(self._release, started), daemon=True, name="sleep-inhibitor").start()
+        started.wait(1)
+
+    def _hold(self, release, started):
+        import ctypes
+
+        kernel32 = ctypes.windll.kernel32
+        if not kernel32.SetThreadExecutionState(ES_CONTINUOUS | ES_SYSTEM_REQUIRED | ES_DISPLAY_REQUIRED):
+            log.warning("Could not prevent sleep: SetThreadExecutionState failed")
+        started.set()
+        release.wait()
+        kernel32.SetThreadExecutionState(ES_CONTINUOUS)
+
+    def release(self):
+        if self._release is not None:
+            self._release.set()
+            self._release = None
+
+
+class _CommandBackend:
+    # One helper process holds the inhibition for as long as it runs; it also
+    # watches our PID, so a crash can't leave the machine awake for good
+    def __init__(self, name, command):
+        self.name = name
+        self.command = command
+        self._process = None
+
+    def acquire(self):
+        process = subprocess.Popen(self.command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                   stderr=subprocess.DEVNULL)
+        try:
+            # A helper that can't get the lock (no logind, say) gives up at once
+            code = process.wait(timeout=0.2)
+        except subprocess.TimeoutExpired:
+            self._process = process
+            return
+        raise OSError(f"{self.name} exited with status {code}")
+
+    def release(self):
+        process, self._process = self._process, None
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=2)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+class _NullBackend:
+    name = "none"
+
+    def acquire(self):
+        pass
+
+    def release(self):
+        pass
+
+
+def _default_backend():
+    pid = str(os.getpid())
+    if sys.platform == "win32":
+        return _WindowsBackend()
+    if sys.platform == "darwin" and shutil.which("caffeinate"):
+        return _CommandBackend("caffeinate", ["caffeinate", "-d", "-i", "-w", pid])
+    if sys.platform.startswith("linux") and shutil.which("systemd-inhibit") and shutil.which("tail"):
+        # systemd-inhibit takes a logind inhibitor lock over D-Bus for as long as its command runs
+        return _CommandBackend("systemd-inhibit", [
+            "systemd-inhibit", "--what=sleep:idle", "--who=Chain Watcher", f"--why={INHIBIT_REASON}",
+            "--mode=block", "tail", f"--pid={pid}", "-f", "/dev/null"])
+    return _NullBackend()
+
+
+class SleepInhibitor:
+    """Keep the computer from sleeping while enabled.
+
+    The platform mechanism is taken once when enabled and let go once when
+    disabled, however often `set_enabled` is called in between: the Windows
+    execution state on a thread of its own, `systemd-inhibit` on Linux and
+    `caffeinate` on macOS; elsewhere it does nothing.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend if backend is not None else _default_backend()
+        self.enabled = False
+        self.failed = False  # Acquiring failed; not retried until disabled and enabled again
+        self._lock = threading.Lock()
+
+    def set_enabled(self, enabled):
+        with self._lock:
+            if not enabled:
+                self.failed = False
+            if enabled == self.enabled or (enabled and self.failed):
+                return
+            try:
+                if enabled:
+                    self.backend.acquire()
+                else:
+                    self.backend.release()
+            except OSError as e:
+                log.warning(f"Sleep prevention ({self.backend.name}) failed: {e}")
+                self.failed = enabled
+                return
+            self.enabled = enabled
+
+    def release(self):
+        self.set_enabled(False)
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def get_sleep_inhibitor():
+    """The process-wide `SleepInhibitor`, created on first use."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = SleepInhibitor()
+        return _shared
@@ -0,0 +1,250 @@
+import collections
+import contextlib
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+from chain_config import DATA_FOLDER
+
+
+# Sampling profiler: stack samples per second, and the deepest stack kept
+SAMPLE_INTERVAL = 0.02
+MAX_STACK_DEPTH = 40
+
+# Recent durations kept per span for the percentiles
+SPAN_WINDOW = 256
+
+# Allocation sites listed in a dump
+TOP_ALLOCATIONS = 25
+
+_NO_SPAN = contextlib.nullcontext()
+
+log = logging.getLogger("chainwatch.profile")
+
+
+class SpanStats:
+    """Count, total, worst and recent durations of one named span."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.worst = 0.0
+        self.recent = collections.deque(maxlen=SPAN_WINDOW)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.worst = max(self.worst, seconds)
+        self.recent.append(seconds)
+
+    def percentile(self, fraction):
+        if not self.recent:
+            return 0.0
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def describe(self):
+        mean = self.total / self.count if self.count else 0.0
+        return (f"{self.count:>8} {self.total * 1000:>10.1f} {mean * 1000:>8.2f} "
+                f"{self.percentile(0.5) * 1000:>8.2f} {self.percentile(0.95) * 1000:>8.2f} {self.worst * 1000:>8.2f}")
+
+
+class _Span:
+    __slots__ = ("profiler", "name", "started")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.record(self.name, time.perf_counter() - self.started)
+        return False
+
+
+class Profiler:
+    """Spans around the hot paths, a stack sampler and allocation tracing, all off by default.
+
+    `span(name)` times a block; while disabled it returns a shared no-op context,
+    so the hooks can stay in the poll, tick, UI and audio paths for good. Enabled
+    (the Debug toggle), it also samples every thread's stack `SAMPLE_INTERVAL`
+    apart. On a simulated 24h chain, which keeps the engine busy all the time, the
+    two together add under a fifth to its run time; a live watcher, idle between
+    polls and ticks, hardly notices them.
+
+    Allocation tracing slows every allocation, the engine path four to five times
+    over, so Debug leaves it off: `trace_allocations()` starts it, and the next `dump()`
+    takes its snapshot and stops it again. `dump()` writes everything gathered
+    since the profiler was enabled to a text report, with the stack samples in
+    the folded format flame graph tools read.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.enabled = False
+        self.spans = {}
+        self.samples = collections.Counter()  # Folded stack -> times seen
+        self.sample_count = 0
+        self.since = None
+        self._started_tracemalloc = False  # Tracing is ours to stop, not someone else's `tracemalloc.start()`
+        self._stop_sampling = None
+        self._lock = threading.Lock()
+
+    def set_enabled(self, enabled):
+        with self._lock:
+            if enabled == self.enabled:
+                return
+            self.enabled = enabled
+            if enabled:
+                self.spans = {}
+                self.samples = collections.Counter()
+                self.sample_count = 0
+                self.since = time.time()
+                self._stop_sampling = threading.Event()
+                threading.Thread(target=self._sample, args=(self._stop_sampling,), daemon=True,
+                                 name="profile-sampler").start()
+            else:
+                self._stop_sampling.set()
+                self._stop_sampling = None
+                self._stop_tracing()
+
+    def trace_allocations(self):
+        """Trace allocations, one frame each, until the next `dump()`; False if Debug is off."""
+        with self._lock:
+            if not self.enabled:
+                return False
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(1)
+                self._started_tracemalloc = True
+            return True
+
+    def _stop_tracing(self):
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def span(self, name):
+        """Context manager timing the block under `name`, when enabled."""
+        if not self.enabled:
+            return _NO_SPAN
+        return _Span(self, name)
+
+    def record(self, name, seconds):
+        with self._lock:
+            stats = self.spans.get(name)
+            if stats is None:
+                stats = self.spans[name] = SpanStats()
+            stats.add(seconds)
+
+    def _sample(self, stop):
+        own = threading.get_ident()
+        while not stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            folded = []
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                folded.append(";".join(reversed(stack)))
+            with self._lock:
+                self.samples.update(folded)
+                self.sample_count += 1
+
+    def report(self):
+        """The spans, hottest stacks and allocations as text."""
+        with self._lock:
+            spans = sorted(self.spans.items(), key=lambda item: -item[1].total)
+            lines = [f"Chain Watcher profile, {datetime.now():%Y-%m-%d %H:%M:%S}",
+                     f"Enabled since {datetime.fromtimestamp(self.since):%H:%M:%S}" if self.since else "Not enabled",
+                     "",
+                     f"{'span':<20} {'count':>8} {'total ms':>10} {'mean':>8} {'p50':>8} {'p95':>8} {'max':>8}"]
+            lines += [f"{name:<20} {stats.describe()}" for name, stats in spans]
+            lines += ["", f"Stack samples ({self.sample_count} rounds, {self.interval * 1000:.0f}ms apart), folded:"]
+            lines += [f"{stack} {count}" for stack, count in self.samples.most_common()]
+
+        if tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot().filter_traces(
+                (tracemalloc.Filter(False, tracemalloc.__file__),))
+            current, peak = tracemalloc.get_traced_memory()
+            lines += ["", f"Traced memory: {current / 1024:.0f} KiB now, {peak / 1024:.0f} KiB peak",
+                      f"Top {TOP_ALLOCATIONS} sites of the allocations still live since tracing started:"]
+            lines += [str(stat) for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]]
+        else:
+            lines += ["", "Allocations not traced (start tracing before the dump to include them)"]
+        return "\n".join(lines) + "\n"
+
+    def dump(self, folder=DATA_FOLDER):
+        """Write `report()` to a timestamped file in `folder`, ending allocation tracing; returns its path."""
+        try:
+            report = self.report()
+        finally:
+            with self._lock:
+                self._stop_tracing()
+        os.makedirs(folder, exist_ok=True)
+        stem = os.path.join(folder, f"profile-{datetime.now():%Y%m%d-%H%M%S}")
+        path, number = stem + ".txt", 1
+        while os.path.exists(path):
+            number += 1
+            path = f"{stem}-{number}.txt"
+        with open(path, "w") as f:
+            f.write(report)
+        log.info(f"Profile written to {path}")
+        return path
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def get_profiler():
+    """The process-wide `Profiler`, created on first use."""
+    global _shared
+    if _shared is not None:
+        return _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = Profiler()
+        return _shared
+
+
+def span(name):
+    """Time a block with the process-wide profiler (a no-op unless it is enabled)."""
+    return get_profiler().span(name)
+
+
+def install_dump_signal():
+    """Dump the profile on SIGUSR1 (`kill -USR1 <pid>`), and trace allocations from SIGUSR2 on, where there are such signals."""
+    if not hasattr(signal, "SIGUSR1"):
+        return False
+
+    def handle(signum, frame):
+        # Write from a thread of its own: the handler runs between bytecodes of the main thread
+        threading.Thread(target=_dump_quietly, daemon=True, name="profile-dump").start()
+
+    def handle_trace(signum, frame):
+        threading.Thread(target=get_profiler().trace_allocations, daemon=True, name="profile-trace").start()
+
+    signal.signal(signal.SIGUSR1, handle)
+    if hasattr(signal, "SIGUSR2"):
+        signal.signal(signal.SIGUSR2, handle_trace)
+    return True
+
+
+def _dump_quietly():
+    try:
+        get_profiler().dump()
+    except OSError as e:
+        log.warning(f"Could not write the profile: {e}")
@@ -0,0 +1,91 @@
+import random
+import time
+
+
+class Backoff:
+    """Jittered exponential backoff between retries of a failing request.
+
+    The n-th consecutive failure waits around `base * factor ** n`, capped at
+    `cap`, drawn from the upper half of that range so that watchers failing at
+    the same moment (a Torn outage) don't all come back in step.
+    """
+
+    def __init__(self, base=2.0, cap=30.0, factor=2.0, rng=None):
+        self.base = base
+        self.cap = cap
+        self.factor = factor
+        self.failures = 0
+        self._random = rng if rng is not None else random.Random()
+
+    def next_delay(self):
+        delay = min(self.cap, self.base * self.factor ** self.failures)
+        self.failures += 1
+        return delay / 2 + self._random.uniform(0, delay / 2)
+
+    def reset(self):
+        self.failures = 0
+
+
+class CircuitBreaker:
+    """Stop calling a service that keeps failing, and probe it now and then.
+
+    After `threshold` consecutive failures the breaker opens and `allow()` says
+    no for `cooldown` seconds; then one probe call goes through ("half-open").
+    A success closes the breaker again, a failure reopens it with the cooldown
+    doubled, up to `max_cooldown`.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, threshold=5, cooldown=60.0, max_cooldown=300.0, clock=time.monotonic):
+        self.threshold = threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.cooldown = cooldown
+        self.opened_at = None
+
+    def reset(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self.cooldown = self.base_cooldown
+        self.opened_at = None
+
+    def allow(self):
+        """Whether a call may go out now."""
+        if self.state == self.OPEN and self.clock() - self.opened_at >= self.cooldown:
+            self.state = self.HALF_OPEN
+        return self.state != self.OPEN
+
+    def retry_in(self):
+        """Seconds until the open breaker lets a probe through."""
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self.opened_at + self.cooldown - self.clock())
+
+    def record_success(self):
+        """Note a successful call; returns True if that closed the breaker."""
+        was_open = self.state != self.CLOSED
+        self.reset()
+        return was_open
+
+    def release(self):
+        """The half-open probe never reached the service; let the next call probe instead."""
+        if self.state == self.HALF_OPEN:
+            self.state = self.OPEN
+
+    def record_failure(self):
+        """Note a failed call; returns True if that opened the breaker."""
+        self.failures += 1
+        if self.state == self.HALF_OPEN:
+            # The probe failed: stay away for longer
+            self.cooldown = min(self.max_cooldown, self.cooldown * 2)
+        elif self.failures < self.threshold or self.state == self.OPEN:
+            return False
+        self.state = self.OPEN
+        self.opened_at = self.clock()
+        return True
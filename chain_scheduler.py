@@ -0,0 +1,61 @@
+from chain_forecast import HitRateForecast
+
+
+class PollScheduler:
+    """Pick the delay before the next poll from the chain's remaining timeout.
+
+    A chain timer can never run down faster than real time, so while it sits well
+    above the pre-alarm threshold the watcher can sleep through a good part of the
+    headroom. Inside the pre-alarm window the interval shrinks smoothly from
+    `api_interval` to `panic_interval`, which is used from the alarm threshold on.
+    """
+
+    def __init__(self, api_interval=5, panic_interval=2, max_interval=30,
+                 alarm_trigger_seconds=60, pre_alarm_trigger_seconds=90, forecast=None):
+        self.api_interval = api_interval
+        self.panic_interval = panic_interval
+        self.max_interval = max_interval
+        self.alarm_trigger_seconds = alarm_trigger_seconds
+        self.pre_alarm_trigger_seconds = pre_alarm_trigger_seconds
+        # Hit-rate estimate, shared with the engine's break forecast
+        self.forecast = forecast if forecast is not None else HitRateForecast()
+
+    @property
+    def hit_rate(self):
+        """Hits per second."""
+        return self.forecast.rate
+
+    def observe(self, current, now=None, timeout=None):
+        """Update the hit-rate estimate from the chain's `current` count and `timeout`."""
+        self.forecast.observe(current, timeout, now)
+
+    def next_interval(self, remaining, budget_remaining=None, budget_per_minute=None):
+        """Seconds to wait before polling a chain with `remaining` seconds on its timer."""
+        alarm = self.alarm_trigger_seconds
+        pre_alarm = max(self.pre_alarm_trigger_seconds, alarm)
+
+        if remaining <= 0:
+            # No running chain, nothing can break before it starts
+            interval = self.max_interval
+        elif remaining <= alarm:
+            interval = self.panic_interval
+        elif remaining <= pre_alarm:
+            # Ease from the normal to the panic interval across the pre-alarm window
+            fraction = (remaining - alarm) / max(1, pre_alarm - alarm)
+            interval = self.panic_interval + (self.api_interval - self.panic_interval) * fraction
+        else:
+            # Sleep through part of the headroom: all of it is safe, but the busier the
+            # chain the more often the timer resets, so check back sooner to stay fresh
+            headroom = remaining - pre_alarm
+            share = 0.5 + 0.4 / (1 + self.hit_rate * headroom)
+            interval = min(self.max_interval, max(self.api_interval, headroom * share))
+            interval = min(interval, headroom)
+
+        # Never outrun the key budget: spread what is left over the rest of the minute
+        if budget_per_minute:
+            floor = 60.0 / budget_per_minute
+            if budget_remaining is not None and budget_remaining < budget_per_minute / 4:
+                floor *= 4
+            interval = max(interval, floor)
+
+        return interval
@@ -0,0 +1,305 @@
+import bisect
+import heapq
+import json
+import math
+import random
+import sys
+import time
+from datetime import datetime, timezone
+
+from chain_config import DEFAULT_SETTINGS, SETTINGS_FILE, load_settings
+
+
+# Torn resets the chain timer to this many seconds on every hit
+CHAIN_TIMEOUT = 300
+
+# Hit counts at which the chain bonus (and the reported `max`) moves up
+CHAIN_MILESTONES = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000)
+
+
+class VirtualClock:
+    """Simulated time in seconds; call it to read, `advance_to` to move it."""
+
+    def __init__(self, start=0.0):
+        self.current = float(start)
+
+    def __call__(self):
+        return self.current
+
+    def advance_to(self, when):
+        self.current = max(self.current, when)
+
+
+class ChainTrace:
+    """The true state of a chain over time, as keyframes.
+
+    Each frame is `(time, current, end, max, modifier, cooldown)` and holds until
+    the next one; once `end` has passed without a new frame the chain is broken.
+    """
+
+    def __init__(self, frames, start=None, end=None):
+        self.frames = sorted(frames)
+        self.times = [frame[0] for frame in self.frames]
+        self.start = start if start is not None else (self.times[0] if self.times else 0.0)
+        self.end = end if end is not None else (max(frame[2] for frame in self.frames) if self.frames else self.start)
+
+    def frame_at(self, when):
+        index = bisect.bisect_right(self.times, when) - 1
+        if index < 0:
+            return None
+        return self.frames[index]
+
+    def state_at(self, when):
+        """The `chain` object the Torn API would return at server time `when`."""
+        frame = self.frame_at(when)
+        if frame is None or frame[2] <= when:
+            return {"current": 0, "max": 10, "timeout": 0, "modifier": 1.0, "cooldown": 0, "start": 0, "end": 0}
+        _time, current, end, maximum, modifier, cooldown = frame
+        return {"current": current, "max": maximum, "timeout": int(end - when), "modifier": modifier,
+                "cooldown": cooldown, "start": self.start, "end": end}
+
+    def remaining_at(self, when):
+        """True seconds left on the chain at `when`, 0 when there is no chain."""
+        frame = self.frame_at(when)
+        if frame is None or frame[1] == 0:
+            return 0.0
+        return max(0.0, frame[2] - when)
+
+    def breaks(self):
+        """`(last_update, break_time)` for every time a running chain timed out."""
+        breaks = []
+        for frame, following in zip(self.frames, self.frames[1:] + [None]):
+            if frame[1] == 0:
+                continue
+            next_time = following[0] if following is not None else self.end
+            if frame[2] < next_time:
+                breaks.append((frame[0], frame[2]))
+        return breaks
+
+    @classmethod
+    def from_history(cls, history, start=None, end=None):
+        """Rebuild a trace from the polls recorded in a `ChainHistory`."""
+        rows = history.read(start, end)
+        frames = []
+        for row in rows:
+            timestamp, current, maximum, timeout, modifier, cooldown, _latency, error = (row[i] for i in range(8))
+            if error:
+                continue
+            if frames and frames[-1][1] == int(current):
+                continue  # Same count as the last poll, so no hit since; keep the first sighting
+            timestamp = float(timestamp)
+            chain_end = timestamp + int(timeout) if int(current) else timestamp
+            frames.append((timestamp, int(current), chain_end, int(maximum), float(modifier), int(cooldown)))
+        if not frames:
+            raise ValueError("No successful polls in the selected history range")
+        return cls(frames, start=frames[0][0], end=float(rows[-1][0]))
+
+    @classmethod
+    def synthetic(cls, duration, hits_per_minute=1.0, timeout=CHAIN_TIMEOUT, start=None, seed=None):
+        """Random hits at a steady average rate, breaking and restarting when a gap outlasts `timeout`."""
+        rng = random.Random(seed)
+        start = math.floor(time.time()) if start is None else start
+        frames = []
+        now, current, chain_end = start, 0, start
+        while True:
+            now += rng.expovariate(hits_per_minute / 60)
+            if now >= start + duration:
+                break
+            current = current + 1 if now < chain_end else 1
+            chain_end = now + timeout
+            maximum = next((milestone for milestone in CHAIN_MILESTONES if milestone > current), CHAIN_MILESTONES[-1])
+            frames.append((now, current, chain_end, maximum, 1.0, 0))
+        return cls(frames, start=start, end=start + duration)
+
+
+class TraceClient:
+    """Stand-in for `TornApiClient` answering from a `ChainTrace` on virtual time."""
+
+    def __init__(self, trace, clock, latency=0.15, error_rate=0.0, seed=None):
+        from torn_api import KeyPool
+
+        self.trace = trace
+        self.clock = clock
+        self.latency = latency
+        self.error_rate = error_rate
+        self.key_pool = KeyPool(clock=clock)
+        self.last_timing = None
+        self._random = random.Random(seed)
+
+    def chain_url(self, faction_id=None):
+        return f"trace://faction/{faction_id or ''}"
+
+    def get_chain(self, faction_id=None, hedge=False, extra_selections=(), since=None):
+        from torn_api import RequestTiming
+
+        self.key_pool.acquire()
+        if self._random.random() < self.error_rate:
+            raise ConnectionError("Simulated API failure")
+        sent = self.clock()
+        received = sent + self.latency
+        # The server answers halfway through the round trip, stamping whole seconds
+        server_time = math.floor(sent + self.latency / 2)
+        timing = RequestTiming(total=self.latency, ttfb=self.latency)
+        timing.sent = sent
+        timing.received = received
+        timing.server_time = server_time
+        self.last_timing = timing
+        data = {"chain": self.trace.state_at(sent + self.latency / 2), "timestamp": server_time}
+        return data, timing
+
+    def close(self):
+        pass
+
+
+class SimulationReport:
+    """Collects alarm transitions and poll counts from the engine's events."""
+
+    def __init__(self, trace):
+        self.trace = trace
+        self.transitions = []
+        self.polls = 0
+        self.failed_polls = 0
+
+    def __call__(self, event):
+        if event["type"] in ("poll", "poll_unchanged"):
+            self.polls += 1
+        elif event["type"] == "poll_failed":
+            self.failed_polls += 1
+        elif event["type"] == "alarm":
+            self.transitions.append({
+                "time": event["time"],
+                "state": event["state"],
+                "previous": event["previous"],
+                "countdown": event["remaining"],
+                "break_risk": round(event["break_risk"], 3),
+                "true_remaining": round(self.trace.remaining_at(event["time"]), 3),
+            })
+
+    def missed_breaks(self):
+        """Chain breaks with no alarm raised between the last hit and the break."""
+        alarm_times = [t["time"] for t in self.transitions if t["state"] == "alarm"]
+        missed = []
+        for last_update, break_time in self.trace.breaks():
+            index = bisect.bisect_right(alarm_times, break_time) - 1
+            if index < 0 or alarm_times[index] < last_update:
+                missed.append(break_time)
+        return missed
+
+    def as_dict(self):
+        return {
+            "start": self.trace.start,
+            "end": self.trace.end,
+            "polls": self.polls,
+            "failed_polls": self.failed_polls,
+            "transitions": self.transitions,
+            "breaks": [break_time for _last_update, break_time in self.trace.breaks()],
+            "missed_breaks": self.missed_breaks(),
+        }
+
+    def describe(self):
+        def stamp(when):
+            return datetime.fromtimestamp(when, timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+        def offset(when):
+            elapsed = int(when - self.trace.start)
+            return f"+{elapsed // 3600:02d}:{elapsed % 3600 // 60:02d}:{elapsed % 60:02d}"
+
+        lines = []
+        for transition in self.transitions:
+            lines.append(f"{stamp(transition['time'])}  {offset(transition['time'])}  "
+                         f"{transition['previous']:>9} -> {transition['state']:<9}  "
+                         f"countdown {transition['countdown']:>3}s  true {transition['true_remaining']:6.1f}s")
+        for _last_update, break_time in self.trace.breaks():
+            lines.append(f"{stamp(break_time)}  {offset(break_time)}  chain broke")
+        lines.sort()
+
+        hours = (self.trace.end - self.trace.start) / 3600
+        alarms = sum(1 for t in self.transitions if t["state"] == "alarm")
+        pre_alarms = sum(1 for t in self.transitions if t["state"] == "pre-alarm")
+        lines.append("")
+        lines.append(f"Simulated {hours:.2f}h: {self.polls} polls ({self.failed_polls} failed), "
+                     f"{pre_alarms} pre-alarms, {alarms} alarms, {len(self.trace.breaks())} breaks, "
+                     f"{len(self.missed_breaks())} breaks without an alarm")
+        return "\n".join(lines)
+
+
+def simulate(trace, settings=None, speed=0.0, latency=0.15, error_rate=0.0, seed=None):
+    """Replay `trace` through `ChainEngine`'s polling, countdown and alarm logic.
+
+    Polls and ticks are taken from an event queue on a `VirtualClock`, so a day of
+    chain runs in seconds; `speed` > 0 instead paces it at that multiple of real time.
+    """
+    # The engine (and requests with it) only loads when a simulation runs
+    from chain_engine import ChainEngine
+
+    clock = VirtualClock(trace.start)
+    client = TraceClient(trace, clock, latency=latency, error_rate=error_rate, seed=seed)
+    simulation_settings = dict(DEFAULT_SETTINGS)
+    simulation_settings.update(settings or {})
+    # One pool key with the real budget, and nothing written to the real history
+    simulation_settings.update(api_key="simulated", faction_id="", watch_factions="", record_history=False)
+    engine = ChainEngine(simulation_settings, client, clock=clock)
+    report = SimulationReport(trace)
+    engine.subscribe(report)
+
+    # (virtual time, order, kind): polls and ticks, like `watch_chain` and `update_timer_loop`
+    queue = [(trace.start, 0, "poll"), (trace.start, 1, "tick")]
+    order = 2
+    real_start = time.perf_counter()
+    while queue:
+        when, _order, kind = heapq.heappop(queue)
+        if when > trace.end:
+            break
+        if speed > 0:
+            delay = real_start + (when - trace.start) / speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        clock.advance_to(when)
+        if kind == "poll":
+            next_time = when + engine.poll_once()
+        else:
+            engine.tick()
+            next_time = when + engine.server_clock.time_to_next_second() + 0.005
+        heapq.heappush(queue, (next_time, order, kind))
+        order += 1
+    return report
+
+
+def add_simulate_arguments(parser):
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--history", metavar="FILE", help="Replay a recorded chain history file")
+    source.add_argument("--hours", type=float, default=24.0,
+                        help="Length of a synthetic chain in hours (default: %(default)s)")
+    parser.add_argument("--since", type=float, help="With --history: start at this epoch time")
+    parser.add_argument("--until", type=float, help="With --history: stop at this epoch time")
+    parser.add_argument("--hit-rate", type=float, default=1.0,
+                        help="Synthetic chain: average hits per minute (default: %(default)s)")
+    parser.add_argument("--seed", type=int, help="Random seed for the synthetic chain and failures")
+    parser.add_argument("--config", default=SETTINGS_FILE,
+                        help="Settings file with the thresholds to test (default: %(default)s)")
+    parser.add_argument("--latency", type=float, default=0.15, help="Simulated request latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of polls that fail")
+    parser.add_argument("--speed", type=float, default=0.0,
+                        help="Pace at this multiple of real time, e.g. 1000 (default: as fast as possible)")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+
+
+def run_simulation(args):
+    if args.history:
+        from chain_history import ChainHistory
+        try:
+            trace = ChainTrace.from_history(ChainHistory(args.history), args.since, args.until)
+        except (ValueError, OSError) as e:
+            print(f"Cannot replay {args.history}: {e}", file=sys.stderr)
+            return 1
+    else:
+        trace = ChainTrace.synthetic(args.hours * 3600, args.hit_rate, seed=args.seed)
+
+    settings = load_settings(args.config)
+    report = simulate(trace, settings, speed=args.speed, latency=args.latency,
+                      error_rate=args.error_rate, seed=args.seed)
+    if args.json:
+        print(json.dumps(report.as_dict(), indent=2))
+    else:
+        print(report.describe())
+    return 0
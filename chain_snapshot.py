@@ -0,0 +1,105 @@
+import json
+import logging
+import os
+import threading
+
+from chain_config import DATA_FOLDER, write_json_atomic
+
+
+STATE_FILE = os.path.join(DATA_FOLDER, "chain_state.json")
+STATE_VERSION = 1
+
+# Seconds a changed state waits before it is written, so a burst of polls costs one write
+WRITE_DELAY = 2.0
+
+# Events after which the state may have changed
+STATE_EVENTS = ("started", "stopped", "poll", "upstream_update", "hits")
+
+log = logging.getLogger("chainwatch.snapshot")
+
+
+def load_state(path=STATE_FILE):
+    """The saved chain state, or None if there is none (or it is unreadable)."""
+    try:
+        with open(path, "r") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(state, dict) or state.get("version") != STATE_VERSION:
+        return None
+    return state
+
+
+def engine_state(engine):
+    """What a restarted watcher needs to show the countdown before its first poll."""
+    chain = engine.chain
+    return {"version": STATE_VERSION,
+            "chain_end_time": engine.chain_end_time,
+            "timeout": chain.get("timeout", 0),
+            "current": chain.get("current", 0),
+            "max": chain.get("max", 0),
+            "server_offset": engine.server_clock.local_offset(),
+            "faction_id": engine.settings["faction_id"],
+            "watching": engine.running}
+
+
+class StateSnapshot:
+    """Engine listener keeping the chain state on disk for an instant resume.
+
+    Events that may change the state only mark it dirty; a background thread
+    writes it `delay` seconds later, if it differs from what was last written,
+    through a temporary file and a rename so a crash mid-write leaves the old
+    file intact. Stopping is written at once, so a deliberate stop is never
+    resumed.
+    """
+
+    def __init__(self, engine, path=STATE_FILE, delay=WRITE_DELAY):
+        self.engine = engine
+        self.path = path
+        self.delay = delay
+        self.writes = 0
+        self._written = None  # Last state written, less the clock offset that drifts with every poll
+        self._dirty = threading.Event()
+        self._closed = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="state-snapshot")
+        self._thread.start()
+
+    def __call__(self, event):
+        if event["type"] not in STATE_EVENTS:
+            return
+        if event["type"] == "stopped":
+            # Written at once: it is the last event of the run and must not be lost
+            self.flush()
+        else:
+            self._dirty.set()
+
+    def _run(self):
+        while not self._closed.is_set():
+            self._dirty.wait()
+            if self._closed.wait(self.delay):
+                return
+            self._dirty.clear()
+            self.flush()
+
+    def flush(self):
+        """Write the current state now if it changed since the last write."""
+        state = engine_state(self.engine)
+        key = dict(state, server_offset=None)
+        with self._lock:
+            if key == self._written:
+                return
+            try:
+                write_json_atomic(self.path, state)
+            except OSError as e:
+                log.warning(f"Could not save the chain state: {e}")
+                return
+            self._written = key
+            self.writes += 1
+
+    def close(self):
+        self._closed.set()
+        self._dirty.set()
+        self._thread.join(1)
+        self.flush()
+
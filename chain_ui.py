@@ -0,0 +1,103 @@
+import logging
+import threading
+
+from chain_profile import span
+
+
+log = logging.getLogger("chainwatch.ui")
+
+
+class UiUpdateQueue:
+    """Hand widget state from worker threads to the Tk main loop.
+
+    Workers `publish` a value under a key; only the newest value per key is kept
+    until the main loop drains the queue through `after()`, and a bound callback
+    runs only when its value differs from what was last drawn. Worker threads
+    therefore never touch Tk directly and redundant redraws are dropped.
+    """
+
+    def __init__(self, root, interval_ms=50):
+        self.root = root
+        self.interval_ms = interval_ms
+        self._handlers = {}
+        self._pending = {}
+        self._applied = {}
+        self._lock = threading.Lock()
+        self._job = None
+
+    def bind(self, key, handler):
+        """Call `handler(value)` on the main loop whenever `key` gets a new value."""
+        self._handlers[key] = handler
+
+    def publish(self, key, value):
+        """Queue `value` for `key`; safe to call from any thread and never blocks on Tk."""
+        with self._lock:
+            self._pending[key] = value
+
+    def start(self):
+        if self._job is None:
+            self._job = self.root.after(self.interval_ms, self._drain)
+
+    def stop(self):
+        if self._job is not None:
+            self.root.after_cancel(self._job)
+            self._job = None
+
+    def _drain(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        try:
+            with span("ui dispatch"):
+                for key, value in pending.items():
+                    if key in self._applied and self._applied[key] == value:
+                        continue
+                    self._applied[key] = value
+                    handler = self._handlers.get(key)
+                    if handler is None:
+                        continue
+                    try:
+                        handler(value)
+                    except Exception:
+                        # One broken widget update must not hold up the others
+                        log.exception(f"UI update {key!r} failed")
+        finally:
+            self._job = self.root.after(self.interval_ms, self._drain)
+
+
+class FlashAnimation:
+    """Non-blocking background flash driven by `after()` on the Tk main loop.
+
+    A flash requested while one is already running is merged into it, and the
+    window falls back to the latest requested background when it finishes.
+    """
+
+    def __init__(self, root, colors=("yellow", "red"), repeats=3, frame_ms=200):
+        self.root = root
+        self.frames = list(colors) * repeats
+        self.frame_ms = frame_ms
+        self.background = root.cget("bg")
+        self._remaining = []
+        self._job = None
+
+    @property
+    def running(self):
+        return self._job is not None
+
+    def set_background(self, color):
+        self.background = color
+        if not self.running:
+            self.root.config(bg=color)
+
+    def flash(self, *args):
+        if self.running:
+            return
+        self._remaining = list(self.frames)
+        self._next_frame()
+
+    def _next_frame(self):
+        if not self._remaining:
+            self._job = None
+            self.root.config(bg=self.background)
+            return
+        self.root.config(bg=self._remaining.pop(0))
+        self._job = self.root.after(self.frame_ms, self._next_frame)
@@ -7,10 +7,13 @@ import requests
 import pygame
 import os
 import json
-import sys
+import logging
 import urllib.request
-import platform
-import subprocess
+
+from chain_log import setup_logging
+from chain_power import get_sleep_inhibitor
+
+log = logging.getLogger("chainwatch.archlinux")
 
 # Initialize Pygame mixer for alarm sounds
 pygame.mixer.init()
@@ -59,7 +62,8 @@ class ChainWatcherApp:
         self.running = False
         self.panic_mode = False
 
-        self.caffeinate_process = None
+        # One inhibitor for the whole run instead of a new `caffeinate` on every poll
+        self.sleep_inhibitor = get_sleep_inhibitor()
 
         # Load settings and GUI setup
         self.load_settings()
@@ -67,11 +71,8 @@ class ChainWatcherApp:
         self.setup_gui()
 
     def prevent_sleep_mode(self, enable=True):
-        if platform.system() == 'Linux':
-            if enable:
-                self.caffeinate_process = subprocess.Popen(['caffeinate'])
-            elif self.caffeinate_process:
-                self.caffeinate_process.terminate()
+        # Taken once and released once, however often this is called
+        self.sleep_inhibitor.set_enabled(enable)
 
     def setup_gui(self):
         self.time_label = tk.Label(self.root, text="T-: 00:00", font=("Helvetica", 60))
@@ -115,8 +116,7 @@ class ChainWatcherApp:
         api_failed = False
         while self.running:
             interval = self.panic_interval.get() if api_failed else self.api_interval.get()
-            if self.prevent_sleep.get():
-                self.prevent_sleep_mode(True)
+            self.prevent_sleep_mode(self.prevent_sleep.get())
 
             try:
                 response = requests.get(api_url)
@@ -126,7 +126,7 @@ class ChainWatcherApp:
                 api_failed = False
                 self.root.config(bg="#F0F0F0")
             except Exception as e:
-                print(f"API request failed: {e}", file=sys.stderr)
+                log.warning(f"API request failed: {e}")
                 api_failed = True
                 self.flash_failure()
 
@@ -149,6 +149,7 @@ class ChainWatcherApp:
 
 # Main Application
 if __name__ == "__main__":
+    setup_logging()
     root = tk.Tk()
     app = ChainWatcherApp(root)
     root.mainloop()
@@ -0,0 +1,644 @@
+import collections
+import hashlib
+import json
+import logging
+import re
+import socket
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError
+
+from chain_config import API_BASE_URL
+from chain_profile import span
+
+try:
+    # Several times faster than the standard library decoder
+    from orjson import loads as _json_loads
+except ImportError:
+    _json_loads = json.loads
+
+log = logging.getLogger("chainwatch.api")
+
+
+# Torn allows this many requests per minute for each API key
+TORN_RATE_LIMIT = 100
+
+# Separate connect and read timeouts so a hung request can never freeze the watcher
+DEFAULT_CONNECT_TIMEOUT = 3.05
+DEFAULT_READ_TIMEOUT = 10
+
+# Torn error codes by what to do about them; see https://www.torn.com/api.html
+KEY_ERROR_CODES = {1, 2, 10, 13, 16, 18}  # Empty, wrong, jailed owner, inactive, access level, paused
+RATE_LIMIT_CODES = {5}  # Too many requests
+TEMPORARY_ERROR_CODES = {0, 8, 9, 11, 12, 14, 15, 17}  # IP block, API down, daily limit, backend errors
+# Refusals of an extra selection (private, or above the key's access level): not the key's fault for the chain
+SELECTION_ACCESS_CODES = {7, 16}
+
+# How long a key is left out of the pool after Torn refused it (seconds)
+KEY_QUARANTINE_SECONDS = 600
+RATE_LIMIT_QUARANTINE_SECONDS = 30
+
+# A hedged request sends its second copy once the first has taken longer than this
+# share of recent requests, and only once that many latencies have been seen
+HEDGE_PERCENTILE = 0.9
+HEDGE_MIN_SAMPLES = 10
+
+# Connection phases recorded by the timed connection classes for the current thread
+_phase_timings = threading.local()
+
+# Fields that change every second even when nothing happened to the chain
+_VOLATILE_FIELDS = re.compile(rb'"(timestamp|timeout)"\s*:\s*(-?\d+)')
+
+
+def _record_phase(name, seconds):
+    phases = getattr(_phase_timings, "phases", None)
+    if phases is not None:
+        phases[name] = phases.get(name, 0.0) + seconds
+
+
+class _TimedConnectionMixin:
+    # Split the socket setup into a DNS lookup and a TCP connect so both can be timed;
+    # every resolved address (IPv4 and IPv6) is tried in turn, as urllib3 would
+    def _new_conn(self):
+        host = self._dns_host
+        start = time.perf_counter()
+        try:
+            addresses = list(dict.fromkeys(
+                info[4][0] for info in socket.getaddrinfo(host, self.port, 0, socket.SOCK_STREAM)))
+        except OSError:
+            # Let urllib3 raise its own resolution error
+            addresses = [host]
+        _record_phase("dns", time.perf_counter() - start)
+
+        start = time.perf_counter()
+        try:
+            for index, address in enumerate(addresses):
+                self._dns_host = address
+                try:
+                    return super()._new_conn()
+                except ConnectTimeoutError:
+                    # NewConnectionError included: move on to the next address, if any
+                    if index == len(addresses) - 1:
+                        raise
+        finally:
+            self._dns_host = host
+            _record_phase("connect", time.perf_counter() - start)
+
+
+class _TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    def connect(self):
+        start = time.perf_counter()
+        phases = getattr(_phase_timings, "phases", None) or {}
+        before = phases.get("dns", 0.0) + phases.get("connect", 0.0)
+        super().connect()
+        phases = getattr(_phase_timings, "phases", None) or {}
+        after = phases.get("dns", 0.0) + phases.get("connect", 0.0)
+        # Whatever connect() spent outside of DNS and TCP is the TLS handshake
+        _record_phase("tls", max(0.0, time.perf_counter() - start - (after - before)))
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class _TimedAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimedHTTPConnectionPool,
+            "https": _TimedHTTPSConnectionPool,
+        }
+
+
+class ApiBudgetExhausted(Exception):
+    """Raised when no API key has request budget left within the wait limit."""
+
+
+class TornApiError(Exception):
+    """The Torn API answered with an error object instead of the data."""
+
+    def __init__(self, code, message, api_key=None):
+        super().__init__(f"Torn API error {code}: {message}")
+        self.code = code
+        self.message = message
+        self.api_key = api_key  # The key the request was sent with
+
+
+def classify_error(error):
+    """Sort a failed request into what should happen next.
+
+    "key"         Torn refused the key; leave it out of the pool for a while
+    "rate_limit"  the key went over its limit; rest it and slow down
+    "budget"      no key had budget left, so nothing was sent
+    "request"     the request itself is wrong (faction ID, selection); retrying won't help soon
+    "temporary"   Torn, the network or the HTTP layer failed; back off and retry
+    """
+    if isinstance(error, TornApiError):
+        if error.code in KEY_ERROR_CODES:
+            return "key"
+        if error.code in RATE_LIMIT_CODES:
+            return "rate_limit"
+        if error.code in TEMPORARY_ERROR_CODES:
+            return "temporary"
+        return "request"
+    if isinstance(error, ApiBudgetExhausted):
+        return "budget"
+    if isinstance(error, requests.HTTPError) and error.response is not None and error.response.status_code == 429:
+        return "rate_limit"
+    return "temporary"
+
+
+class TokenBucket:
+    """Rolling request budget refilled continuously at `rate` tokens per second."""
+
+    def __init__(self, capacity, rate, clock=time.monotonic):
+        self.capacity = capacity
+        self.rate = rate
+        self.clock = clock
+        self.tokens = float(capacity)
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self):
+        self._refill()
+        return self.tokens
+
+    def try_take(self):
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def time_until_available(self):
+        self._refill()
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class SlidingWindow:
+    """At most `limit` requests in any `window` seconds, counted from their send times.
+
+    Unlike a token bucket, whose full burst plus a window's refill lets nearly twice
+    the limit through in one rolling minute, this holds to the limit as Torn counts it.
+    """
+
+    def __init__(self, limit, window=60.0, clock=time.monotonic):
+        self.limit = limit
+        self.window = window
+        self.clock = clock
+        self.sent = collections.deque()
+
+    def _expire(self):
+        cutoff = self.clock() - self.window
+        while self.sent and self.sent[0] <= cutoff:
+            self.sent.popleft()
+
+    def available(self):
+        self._expire()
+        return self.limit - len(self.sent)
+
+    def try_take(self):
+        self._expire()
+        if len(self.sent) < self.limit:
+            self.sent.append(self.clock())
+            return True
+        return False
+
+    def time_until_available(self):
+        self._expire()
+        if len(self.sent) < self.limit:
+            return 0.0
+        return max(0.0, self.sent[0] + self.window - self.clock())
+
+
+class KeyPool:
+    """Spread requests over several API keys, each with its own per-minute budget.
+
+    Every request goes to the key with the most budget left, so a pool of N keys
+    sustains N times the Torn rate limit before anything gets throttled. Each key's
+    budget is a sliding 60 second window of its requests, as Torn counts them.
+    """
+
+    def __init__(self, keys=(), limit_per_minute=TORN_RATE_LIMIT, clock=time.monotonic):
+        self.limit_per_minute = limit_per_minute
+        self.clock = clock
+        self.buckets = {}
+        self.quarantined = {}  # Key -> clock time it may be used again
+        self._lock = threading.Lock()
+        self.set_keys(keys)
+
+    def __len__(self):
+        return len(self.buckets)
+
+    def set_keys(self, keys):
+        """Replace the pooled keys, keeping the spent budget of keys that stay."""
+        with self._lock:
+            self.buckets = {
+                key: self.buckets.get(key) or SlidingWindow(self.limit_per_minute, 60.0, self.clock)
+                for key in keys
+            }
+            self.quarantined = {key: until for key, until in self.quarantined.items() if key in self.buckets}
+
+    def quarantine(self, key, seconds):
+        """Leave `key` out of the pool for `seconds`."""
+        with self._lock:
+            if key in self.buckets:
+                self.quarantined[key] = max(self.quarantined.get(key, 0.0), self.clock() + seconds)
+
+    def _usable(self):
+        # Buckets of the keys out of quarantine; called with the lock held
+        now = self.clock()
+        for key, until in list(self.quarantined.items()):
+            if until <= now:
+                del self.quarantined[key]
+        return [(key, bucket) for key, bucket in self.buckets.items() if key not in self.quarantined]
+
+    def acquire(self, wait=0.0, exclude=None):
+        """Take one request from the key with the most budget, waiting up to `wait` seconds.
+
+        `exclude` is passed over as long as any other key is in the pool.
+        """
+        deadline = self.clock() + wait
+        while True:
+            with self._lock:
+                if not self.buckets:
+                    raise ApiBudgetExhausted("No API key set")
+                usable = self._usable()
+                if not usable:
+                    raise ApiBudgetExhausted("Every API key is quarantined after Torn refused it")
+                candidates = [item for item in usable if item[0] != exclude] or usable
+                key, bucket = max(candidates, key=lambda item: item[1].available())
+                if bucket.try_take():
+                    return key
+                delay = bucket.time_until_available()
+            if self.clock() + delay > deadline:
+                raise ApiBudgetExhausted(f"API rate budget exhausted, next request in {delay:.1f}s")
+            time.sleep(delay)
+
+    def remaining_budget(self):
+        """Requests that can still be sent right now across the usable keys."""
+        with self._lock:
+            return int(sum(bucket.available() for _key, bucket in self._usable()))
+
+    def budget_per_minute(self):
+        with self._lock:
+            return len(self._usable()) * self.limit_per_minute
+
+    def time_until_available(self):
+        """Seconds until some key can take a request, counting quarantines; None with no keys."""
+        with self._lock:
+            if not self.buckets:
+                return None
+            usable = self._usable()
+            if usable:
+                return min(bucket.time_until_available() for _key, bucket in usable)
+            return max(0.0, min(self.quarantined.values()) - self.clock())
+
+
+def parse_api_keys(text):
+    """Split a comma or space separated list of API keys."""
+    keys = []
+    for key in text.replace(",", " ").split():
+        if key not in keys:
+            keys.append(key)
+    return keys
+
+
+class RequestTiming:
+    """Wall time of one API request, split into connection phases (seconds).
+
+    `sent` and `received` are `time.perf_counter()` readings around the request and
+    `server_time` the server's whole-second timestamp, if the reply carried one.
+    """
+
+    def __init__(self, dns=0.0, connect=0.0, tls=0.0, ttfb=0.0, total=0.0):
+        self.dns = dns
+        self.connect = connect
+        self.tls = tls
+        self.ttfb = ttfb
+        self.total = total
+        self.sent = 0.0
+        self.received = 0.0
+        self.server_time = None
+        self.unchanged = False  # Body matched the previous one and was not decoded again
+        self.hedged = False  # A second copy of the request was sent
+        self.hedge_won = False  # ...and answered first
+
+    @property
+    def reused(self):
+        # No handshake phases means the request went out on a pooled connection
+        return self.dns == 0.0 and self.connect == 0.0 and self.tls == 0.0
+
+    @property
+    def handshake(self):
+        return self.dns + self.connect + self.tls
+
+    def as_dict(self):
+        return {"dns": self.dns, "connect": self.connect, "tls": self.tls,
+                "ttfb": self.ttfb, "total": self.total, "reused": self.reused, "unchanged": self.unchanged,
+                "hedged": self.hedged, "hedge_won": self.hedge_won}
+
+    def describe(self):
+        text = (f"dns={self.dns * 1000:.1f}ms connect={self.connect * 1000:.1f}ms "
+                f"tls={self.tls * 1000:.1f}ms ttfb={self.ttfb * 1000:.1f}ms "
+                f"total={self.total * 1000:.1f}ms")
+        if self.reused:
+            text += " (reused connection)"
+        if self.unchanged:
+            text += " (unchanged)"
+        if self.hedged:
+            text += " (hedge answered first)" if self.hedge_won else " (hedged, first answered first)"
+        return text
+
+
+class LatencyTracker:
+    """The latest request latencies, for percentiles."""
+
+    def __init__(self, size=200):
+        self.samples = collections.deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def percentile(self, fraction, min_samples=HEDGE_MIN_SAMPLES):
+        """The `fraction` percentile, or None with fewer than `min_samples` latencies."""
+        with self._lock:
+            if len(self.samples) < min_samples:
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class HedgeStats:
+    """What hedged requests cost in extra API budget and won in latency."""
+
+    def __init__(self):
+        self.requests = 0  # Calls that could be hedged
+        self.hedges = 0  # Second copies sent
+        self.wins = 0  # Second copies that answered first
+        self.saved = 0.0  # Seconds the winning copies came in before the first ones finished
+        self._lock = threading.Lock()
+
+    def add(self, requests=0, hedges=0, wins=0, saved=0.0):
+        with self._lock:
+            self.requests += requests
+            self.hedges += hedges
+            self.wins += wins
+            self.saved += saved
+
+    def as_dict(self):
+        with self._lock:
+            return {"requests": self.requests, "hedges": self.hedges, "wins": self.wins,
+                    "saved_seconds": round(self.saved, 3)}
+
+    def describe(self):
+        stats = self.as_dict()
+        return (f"Hedging: {stats['hedges']} extra requests over {stats['requests']} polls, "
+                f"{stats['wins']} answered first, {stats['saved_seconds'] * 1000:.0f}ms saved")
+
+
+def _server_time(data, response):
+    # Prefer the API's own timestamp, fall back to the HTTP Date header
+    if isinstance(data, dict) and isinstance(data.get("timestamp"), int):
+        return data["timestamp"]
+    date = response.headers.get("Date")
+    if date:
+        try:
+            return int(parsedate_to_datetime(date).timestamp())
+        except (TypeError, ValueError):
+            pass
+    return None
+
+
+def chain_params(api_key, extra_selections=(), since=None):
+    """Query parameters fetching the chain and `extra_selections` in a single request.
+
+    `timestamp` is always added: it costs nothing extra and lets the caller sync
+    to the server clock. `since` becomes Torn's `from`, so log selections such
+    as `attacks` only carry what happened from then on.
+    """
+    selections = ["chain"] + [selection for selection in extra_selections if selection not in ("chain", "timestamp")]
+    params = {"selections": ",".join(selections + ["timestamp"]), "key": api_key}
+    if since is not None:
+        params["from"] = int(since)
+    return params
+
+
+class TornApiClient:
+    """Keep-alive HTTP client for the Torn API.
+
+    A single pooled session is shared by every poll so panic-mode requests do not
+    pay for a fresh TCP and TLS handshake, and every request is bounded by
+    separate connect and read timeouts. Keys come from a shared `KeyPool`.
+    """
+
+    def __init__(self, base_url=API_BASE_URL, connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout=DEFAULT_READ_TIMEOUT, pool_size=4, key_pool=None):
+        self.base_url = base_url.rstrip("/")
+        self.key_pool = key_pool if key_pool is not None else KeyPool()
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        adapter = _TimedAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers["Accept"] = "application/json"
+        self.last_timing = None
+        self.latencies = LatencyTracker()
+        self.hedge_stats = HedgeStats()
+        self._hedge_executor = None
+        # Key -> monotonic time until which its requests leave out the extra selections Torn refused it
+        self._selections_refused = {}
+        # Per URL and selections: digest of the last body without its volatile fields, the decoded body,
+        # its ETag and the `from` time it was asked for
+        self._responses = {}
+        self._responses_lock = threading.Lock()
+
+    def chain_url(self, faction_id=None):
+        if faction_id:
+            return f"{self.base_url}/faction/{faction_id}"
+        return f"{self.base_url}/faction/"
+
+    def get_chain(self, faction_id=None, hedge=False, extra_selections=(), since=None):
+        """Fetch the chain selection, returning the decoded body and its timing.
+
+        The request is charged to the pooled key with the most budget left. The
+        returned body may be shared with later calls and must not be modified.
+        With `hedge`, a request still out after the p90 of recent latencies gets a
+        second copy on another key and connection, and the first answer wins.
+        `extra_selections` (such as "attacks") come back in the same call, limited
+        to entries from epoch time `since` on (see `chain_params`). A key without
+        access to them is asked for the chain alone for `KEY_QUARANTINE_SECONDS`,
+        so the reply then lacks those selections instead of failing.
+        """
+        request = (faction_id, tuple(extra_selections), since)
+        if hedge:
+            return self._get_chain_hedged(request)
+        return self._get_chain(request)
+
+    def _get_chain_hedged(self, request):
+        delay = self.latencies.percentile(HEDGE_PERCENTILE)
+        if delay is None:
+            # Not enough requests seen yet to know what a slow one is
+            return self._get_chain(request)
+        if self._hedge_executor is None:
+            self._hedge_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="torn-hedge")
+        stats = self.hedge_stats
+        stats.add(requests=1)
+        first_key = self.key_pool.acquire(wait=self.timeout[0])
+        first = self._hedge_executor.submit(self._get_chain, request, first_key)
+        done, _pending = wait([first], timeout=delay)
+        if done:
+            return first.result()
+        try:
+            # Never wait for budget: a hedge that has to queue comes too late anyway
+            second_key = self.key_pool.acquire(exclude=first_key)
+        except ApiBudgetExhausted:
+            return first.result()
+        # The pool hands the copy another connection, since the first still holds its own
+        second = self._hedge_executor.submit(self._get_chain, request, second_key)
+        stats.add(hedges=1)
+
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in (first, second):
+                if future not in done:
+                    continue
+                if future.exception() is not None:
+                    error = error or future.exception()
+                    continue
+                data, timing = future.result()
+                timing.hedged = True
+                timing.hedge_won = future is second
+                if timing.hedge_won:
+                    stats.add(wins=1)
+                    # Credit the time saved once the first copy is done, however it ends
+                    first.add_done_callback(
+                        lambda _future, received=timing.received: stats.add(saved=time.perf_counter() - received))
+                self.last_timing = timing
+                return data, timing
+        raise error
+
+    def _get_chain(self, request, api_key=None):
+        faction_id, extra_selections, since = request
+        if api_key is None:
+            api_key = self.key_pool.acquire(wait=self.timeout[0])
+        if extra_selections and self._selections_refused.get(api_key, 0) > time.monotonic():
+            extra_selections = ()
+        url = self.chain_url(faction_id)
+        params = chain_params(api_key, extra_selections, since)
+        # Replies with other selections don't share a cache entry
+        cache_key = (url, params["selections"])
+        window = params.get("from")
+        with self._responses_lock:
+            cached = self._responses.get(cache_key)
+        if cached is not None and cached[3] != window:
+            # A log from another time holds other attacks: neither its ETag nor its body applies
+            cached = None
+        headers = {"If-None-Match": cached[2]} if cached is not None and cached[2] else None
+        _phase_timings.phases = {}
+        start = time.perf_counter()
+        try:
+            response = self.session.get(url, params=params, headers=headers, timeout=self.timeout)
+            response.raise_for_status()
+            data, unchanged = self._decode(cache_key, window, response, cached)
+        finally:
+            phases = _phase_timings.phases
+            _phase_timings.phases = None
+        received = time.perf_counter()
+
+        timing = RequestTiming(dns=phases.get("dns", 0.0),
+                               connect=phases.get("connect", 0.0),
+                               tls=phases.get("tls", 0.0),
+                               total=received - start)
+        # `elapsed` runs until the response headers are parsed, handshakes included
+        timing.ttfb = max(0.0, response.elapsed.total_seconds() - timing.handshake)
+        timing.sent = start
+        timing.received = received
+        timing.server_time = _server_time(data, response)
+        timing.unchanged = unchanged
+        self.last_timing = timing
+        self.latencies.add(timing.total)
+        if isinstance(data, dict) and "error" in data:
+            error = data["error"]
+            if extra_selections and error.get("code") in SELECTION_ACCESS_CODES:
+                # The key may read the chain but not the extras: ask again for the chain alone
+                self._selections_refused[api_key] = time.monotonic() + KEY_QUARANTINE_SECONDS
+                log.info(f"API key ...{api_key[-4:]} has no access to {', '.join(extra_selections)}; "
+                         f"polling the chain alone with it")
+                return self._get_chain((faction_id, (), since))
+            raise TornApiError(error.get("code"), error.get("error", ""), api_key)
+        if not isinstance(data, dict) or not isinstance(data.get("chain"), dict):
+            raise ValueError("Torn API reply has no chain")
+        return data, timing
+
+    def _decode(self, cache_key, window, response, cached):
+        """Decode the body, or reuse the previous decode if only the clock fields moved.
+
+        `timestamp` and the chain's `timeout` tick every second, so they are cut out
+        with a regex before hashing; when the rest matches the last body, the cached
+        decode is returned with just those two numbers patched in.
+        """
+        if response.status_code == 304 and cached is not None:
+            server_time = _server_time(None, response)
+            data = dict(cached[1])
+            if server_time is not None:
+                data["timestamp"] = server_time
+                chain = data.get("chain")
+                if isinstance(chain, dict) and "end" in chain:
+                    data["chain"] = dict(chain, timeout=max(0, chain["end"] - server_time))
+            return data, True
+
+        body = response.content
+        volatile = {}
+        repeated = False
+
+        def strip(match):
+            nonlocal repeated
+            name = match.group(1).decode()
+            repeated = repeated or name in volatile
+            volatile[name] = int(match.group(2))
+            return b'"' + match.group(1) + b'":0'
+
+        digest = hashlib.blake2b(_VOLATILE_FIELDS.sub(strip, body), digest_size=16).digest()
+        if cached is not None and cached[0] == digest and not repeated:
+            data = dict(cached[1])
+            if "timestamp" in volatile:
+                data["timestamp"] = volatile["timestamp"]
+            if "timeout" in volatile and isinstance(data.get("chain"), dict):
+                data["chain"] = dict(data["chain"], timeout=volatile["timeout"])
+            return data, True
+
+        with span("decode"):
+            data = _json_loads(body)
+        if isinstance(data, dict) and "error" not in data:
+            with self._responses_lock:
+                self._responses[cache_key] = (digest, data, response.headers.get("ETag"), window)
+        return data, False
+
+    def close(self):
+        if self._hedge_executor is not None:
+            self._hedge_executor.shutdown(wait=False)
+        self.session.close()